@@ -0,0 +1,15 @@
+from config.routers import finish_request_routing, start_request_routing
+
+
+class ReplicaRoutingMiddleware:
+    """Передает текущий запрос роутеру баз данных."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_request_routing(request)
+        try:
+            return self.get_response(request)
+        finally:
+            finish_request_routing(token)
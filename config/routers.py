@@ -0,0 +1,88 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import LazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+_routing_state = ContextVar("replica_routing_state", default=None)
+
+
+def sticky_key(user_id):
+    return f"db:read_primary:{user_id}"
+
+
+def start_request_routing(request):
+    return _routing_state.set({"request": request, "wrote": False, "sticky": None})
+
+
+def finish_request_routing(token):
+    """Завершает маршрутизацию запроса; если были записи - включает прилипание."""
+    state = _routing_state.get()
+    _routing_state.reset(token)
+    if state is None or not state["wrote"]:
+        return
+
+    user_id = resolved_user_id(state["request"])
+    if user_id is not None:
+        cache.set(sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def resolved_user_id(request):
+    # Ленивого пользователя из сессии не вычисляем: это запрос к базе,
+    # который сам пришел бы в роутер
+    user = request.__dict__.get("user")
+    if isinstance(user, LazyObject):
+        if user._wrapped is empty:
+            return None
+        user = user._wrapped
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def _reads_from_replica():
+    state = _routing_state.get()
+    if state is None or state["wrote"]:
+        return False
+
+    request = state["request"]
+    if request.method not in SAFE_METHODS:
+        return False
+
+    if state["sticky"] is None:
+        user_id = resolved_user_id(request)
+        if user_id is None:
+            return True
+        # Пользователь недавно писал: читаем с основной базы,
+        # пока реплики не догнали его изменения
+        state["sticky"] = bool(cache.get(sticky_key(user_id)))
+    return not state["sticky"]
+
+
+class ReplicaRouter:
+    """Чтения в безопасных HTTP-запросах уходят на реплики, остальное - на default.
+
+    Вне HTTP-запроса (Celery, management-команды) все идет на default.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _reads_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state["wrote"] = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -60,6 +60,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "config.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -86,13 +87,37 @@ WSGI_APPLICATION = "config.wsgi.application"
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
 }
 
+# Импорт курсов из NDJSON пишет в базу пачками по столько курсов
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", 1000))
+# Выгрузки читают строки из базы серверным курсором пачками по столько строк
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# Платежи разбиты на секции по месяцам, секции создаются на столько месяцев вперед
+PAYMENT_PARTITIONS_AHEAD = int(os.getenv("PAYMENT_PARTITIONS_AHEAD", 3))
+# Секции старше стольких месяцев отключаются от таблицы платежей, 0 - хранить все
+PAYMENT_PARTITIONS_RETAIN_MONTHS = int(os.getenv("PAYMENT_PARTITIONS_RETAIN_MONTHS", 0))
+# Платежи старше стольких месяцев переносятся в gzip-архивы, 0 - не архивировать
+PAYMENT_ARCHIVE_AFTER_MONTHS = int(os.getenv("PAYMENT_ARCHIVE_AFTER_MONTHS", 18))
+# Архивы не кладутся в MEDIA_ROOT: медиафайлы раздаются публично
+PAYMENT_ARCHIVE_ROOT = Path(
+    os.getenv("PAYMENT_ARCHIVE_ROOT", BASE_DIR / "archive" / "payments")
+)
+# Самый длинный диапазон дат, по которому API ищет в архивах платежей
+PAYMENT_ARCHIVE_QUERY_MAX_DAYS = int(os.getenv("PAYMENT_ARCHIVE_QUERY_MAX_DAYS", 31))
+
+# Начиная с этого числа строк пагинация отдает оценку планировщика вместо COUNT(*)
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv("PAGINATION_COUNT_ESTIMATE_THRESHOLD", 100000)
+)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -108,6 +133,74 @@ DATABASES = {
     }
 }
 
+# Пул соединений psycopg3 вместо нового соединения на каждый запрос.
+# Django не дает совмещать пул с CONN_MAX_AGE, поэтому без пула
+# включаются постоянные соединения.
+if os.getenv("DB_POOL", "True") == "True":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+            "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", 60 * 60)),
+            "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 10 * 60)),
+        }
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("CONN_MAX_AGE", 60))
+
+# Проверка соединения перед выдачей из пула или повторным использованием
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = (
+    True if os.getenv("CONN_HEALTH_CHECKS", "True") == "True" else False
+)
+
+# Реплики для чтения: хосты через запятую, остальные параметры как у default
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(
+    filter(None, os.getenv("REPLICA_HOSTS", "").split(",")), start=1
+):
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+DATABASE_ROUTERS = ["config.routers.ReplicaRouter"]
+
+# Сколько секунд после записи пользователь читает с основной базы
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+if os.getenv("CACHE_LOCATION"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("CACHE_LOCATION"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Время жизни закэшированных ответов курсов и уроков, в секундах
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 60 * 60))
+
+# Время жизни закэшированной роли пользователя (модератор или нет), в секундах
+ROLE_CACHE_TIMEOUT = int(os.getenv("ROLE_CACHE_TIMEOUT", 60 * 60))
+
+# Подсказки по названиям курсов и уроков: число подсказок, время жизни
+# закэшированного префикса в секундах и предел времени запроса в мс
+TYPEAHEAD_LIMIT = int(os.getenv("TYPEAHEAD_LIMIT", 10))
+TYPEAHEAD_CACHE_TIMEOUT = int(os.getenv("TYPEAHEAD_CACHE_TIMEOUT", 30))
+TYPEAHEAD_STATEMENT_TIMEOUT = int(os.getenv("TYPEAHEAD_STATEMENT_TIMEOUT", 50))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -158,6 +251,8 @@ AUTH_USER_MODEL = "users.User"
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.UserTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.UserTokenRefreshSerializer",
 }
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
@@ -176,3 +271,13 @@ CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
 
 SERVER_EMAIL = os.getenv('EMAIL_HOST_USER')
 DEFAULT_FROM_EMAIL = os.getenv('EMAIL_HOST_USER')
+
+# Сколько писем об обновлении курса отправляется за одну пачку
+NOTIFICATION_CHUNK_SIZE = int(os.getenv("NOTIFICATION_CHUNK_SIZE", 500))
+# Минимальный интервал между рассылками об обновлении курса
+NOTIFICATION_INTERVAL_HOURS = float(os.getenv("NOTIFICATION_INTERVAL_HOURS", 4))
+# Подписчики курса делятся на шарды, каждый шард - отдельная задача Celery
+NOTIFICATION_SHARD_SIZE = int(os.getenv("NOTIFICATION_SHARD_SIZE", 5000))
+NOTIFICATION_PROGRESS_TIMEOUT = int(os.getenv("NOTIFICATION_PROGRESS_TIMEOUT", 86400))
+# Обновления курса за это окно (в секундах) сливаются в одну рассылку
+NOTIFICATION_COALESCE_WINDOW = int(os.getenv("NOTIFICATION_COALESCE_WINDOW", 60))
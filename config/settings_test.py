@@ -0,0 +1,18 @@
+"""Настройки для тестов: python manage.py test --settings=config.settings_test
+
+Добавляют реплику replica - зеркало основной базы, на которой
+проверяется маршрутизация чтения.
+"""
+
+from config.settings import *  # noqa: F401,F403
+from config.settings import DATABASES
+
+DATABASES = {
+    **DATABASES,
+    "replica": {
+        **DATABASES["default"],
+        # Пул зеркала Django не закрывает перед удалением тестовой базы
+        "OPTIONS": {},
+        "TEST": {"MIRROR": "default"},
+    },
+}
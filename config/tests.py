@@ -0,0 +1,99 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from config.routers import ReplicaRouter, sticky_key
+from materials.models import Course, Lesson
+from users.models import User
+
+
+@skipUnless(
+    "replica" in settings.DATABASES,
+    "нужна реплика replica из config.settings_test",
+)
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTestCase(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="owner@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            name="Урок", course=self.course, owner=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_lessons(self):
+        with (
+            CaptureQueriesContext(connections["default"]) as primary,
+            CaptureQueriesContext(connections["replica"]) as replica,
+        ):
+            response = self.client.get(reverse("materials:lesson_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(primary), len(replica)
+
+    def test_safe_request_reads_from_replica(self):
+        primary_queries, replica_queries = self.get_lessons()
+
+        self.assertEqual(primary_queries, 0)
+        self.assertGreater(replica_queries, 0)
+
+    def test_write_goes_to_primary_and_sticks(self):
+        """После записи пользователь какое-то время читает с основной базы"""
+        url = reverse("materials:lesson_update", kwargs={"pk": self.lesson.pk})
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.patch(url, {"name": "Новое имя"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(replica), 0)
+
+        primary_queries, replica_queries = self.get_lessons()
+        self.assertGreater(primary_queries, 0)
+        self.assertEqual(replica_queries, 0)
+
+        # Окно прилипания истекло
+        cache.delete(sticky_key(self.user.pk))
+        primary_queries, replica_queries = self.get_lessons()
+        self.assertEqual(primary_queries, 0)
+        self.assertGreater(replica_queries, 0)
+
+    def test_reads_outside_request_use_primary(self):
+        self.assertEqual(ReplicaRouter().db_for_read(Lesson), "default")
+
+
+class DatabasePoolStatsAPITestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse("db-pool-stats")
+
+    def test_pool_stats_for_admin(self):
+        self.client.force_authenticate(
+            user=User.objects.create(email="admin@test.com", is_staff=True)
+        )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        if connections["default"].pool is not None:
+            self.assertIn("pool_size", response.data["default"])
+            self.assertEqual(
+                response.data["default"]["max_size"],
+                connections["default"].pool.max_size,
+            )
+
+    def test_pool_stats_for_regular_user(self):
+        self.client.force_authenticate(user=User.objects.create(email="u@test.com"))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -23,6 +23,7 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from config.views import DatabasePoolStatsAPIView
 from users.views import PaymentCourseCreateAPIView
 
 schema_view = get_schema_view(
@@ -43,6 +44,7 @@ urlpatterns = [
     path("materials/", include("materials.urls", namespace="materials")),
     path("users/", include("users.urls", namespace="users")),
     path("payments/", PaymentCourseCreateAPIView.as_view(), name="payment-course"),
+    path("db/pool-stats/", DatabasePoolStatsAPIView.as_view(), name="db-pool-stats"),
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
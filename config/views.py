@@ -0,0 +1,26 @@
+from django.db import connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+def get_database_pool_stats():
+    """Статистика пулов соединений psycopg по алиасам баз данных."""
+    stats = {}
+    for connection in connections.all():
+        pool = getattr(connection, "pool", None)
+        if pool is None:
+            continue
+        stats[connection.alias] = {
+            "min_size": pool.min_size,
+            "max_size": pool.max_size,
+            **pool.get_stats(),
+        }
+    return stats
+
+
+class DatabasePoolStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_database_pool_stats())
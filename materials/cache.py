@@ -0,0 +1,81 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+HITS_KEY = "materials:response_cache:hits"
+MISSES_KEY = "materials:response_cache:misses"
+
+
+def course_version_key(course_id):
+    return f"materials:course:{course_id}:version"
+
+
+def get_course_version(course_id):
+    """Текущая версия курса, входит в ключи всех его закэшированных ответов."""
+    key = course_version_key(course_id)
+    version = cache.get(key)
+    if version is None:
+        # Начальная версия от времени: если ключ версии вытеснили,
+        # старые записи с меньшей версией больше не прочитаются
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _incr_course_version(course_id):
+    key = course_version_key(course_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_course_version(course_id):
+    """Сбрасывает закэшированные ответы курса и его уроков.
+
+    Версия увеличивается сразу, чтобы автор изменения увидел новые данные,
+    и еще раз после коммита, чтобы читатель, попавший между ними,
+    не закрепил в кэше старое состояние под новой версией.
+    """
+    _incr_course_version(course_id)
+    transaction.on_commit(lambda: _incr_course_version(course_id))
+
+
+def _incr_counter(key):
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def get_cached_course_response(course_id, request, name, build):
+    """Отдает данные ответа из кэша или строит их через build() и кэширует."""
+    version = get_course_version(course_id)
+    # Хост входит в ключ: сериализаторы строят абсолютные ссылки на фото
+    key = (
+        f"materials:course:{course_id}:v{version}:{name}:"
+        f"{request.build_absolute_uri('/')}"
+    )
+    data = cache.get(key)
+    if data is not None:
+        _incr_counter(HITS_KEY)
+        return data
+
+    _incr_counter(MISSES_KEY)
+    data = build()
+    cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+    return data
+
+
+def get_response_cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else None,
+    }
@@ -0,0 +1,83 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def not_modified_response(request, etag, last_modified):
+    """Возвращает 304, если у клиента актуальная копия, иначе None."""
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
+
+
+class ConditionalListMixin:
+    """Отвечает 304 на If-None-Match для списков.
+
+    ETag считается по странице: id и updated_at объектов плюс общее
+    количество. Если клиент прислал If-None-Match, сначала загружаются
+    только id и updated_at страницы, а сами объекты с prefetch - лишь когда
+    ETag не совпал. Last-Modified для списков не отдается: удаление строки
+    не меняет максимальный updated_at.
+    """
+
+    def get_list_etag(self, request, keys):
+        # У keyset-пагинации нет count, ссылки зависят от has_next/has_previous
+        django_paginator = getattr(
+            getattr(self.paginator, "page", None), "paginator", None
+        )
+        return make_etag(
+            request.get_full_path(),
+            django_paginator.count if django_paginator is not None else None,
+            getattr(self.paginator, "has_next", None),
+            getattr(self.paginator, "has_previous", None),
+            *((pk, updated_at.isoformat()) for pk, updated_at in keys),
+        )
+
+    def load_page_objects(self, queryset, pks):
+        objects = queryset.in_bulk(pks)
+        return [objects[pk] for pk in pks if pk in objects]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            pk_name = queryset.model._meta.pk.attname
+            rows = queryset.prefetch_related(None).values(pk_name, "updated_at")
+            page = self.paginate_queryset(rows)
+            keys = [
+                (row[pk_name], row["updated_at"])
+                for row in (list(rows) if page is None else page)
+            ]
+            etag = self.get_list_etag(request, keys)
+            not_modified = not_modified_response(request, etag, None)
+            if not_modified is not None:
+                return not_modified
+            objects = self.load_page_objects(queryset, [pk for pk, _ in keys])
+        else:
+            page = self.paginate_queryset(queryset)
+            objects = list(queryset) if page is None else page
+            etag = self.get_list_etag(
+                request, [(obj.pk, obj.updated_at) for obj in objects]
+            )
+
+        serializer = self.get_serializer(objects, many=True)
+        if page is not None:
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response(serializer.data)
+        return set_validators(response, etag, None)
@@ -0,0 +1,68 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+from materials.models import Course, Lesson
+from materials.serializers import CourseImportSerializer
+
+
+def import_courses_ndjson(lines, owner, batch_size=None):
+    """Импортирует курсы с уроками из NDJSON: одна строка - один курс.
+
+    Строка имеет вид {"name": ..., "description": ..., "lessons": [...]}
+    и валидируется CourseImportSerializer. Строки читаются потоком и пишутся
+    пачками через bulk_create, в памяти держится только текущая пачка.
+    Ошибочные строки пропускаются и попадают в отчет с номером строки.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    report = {"lines": 0, "courses": 0, "lessons": 0, "errors": [], "error_count": 0}
+    batch = []
+
+    for number, line in enumerate(lines, start=1):
+        report["lines"] = number
+        try:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.strip():
+                continue
+            data = json.loads(line)
+        except ValueError as e:
+            add_import_error(report, number, str(e))
+            continue
+
+        serializer = CourseImportSerializer(data=data)
+        if not serializer.is_valid():
+            add_import_error(report, number, serializer.errors)
+            continue
+
+        batch.append(serializer.validated_data)
+        if len(batch) >= batch_size:
+            write_import_batch(batch, owner, report)
+            batch = []
+
+    if batch:
+        write_import_batch(batch, owner, report)
+    return report
+
+
+def add_import_error(report, number, errors):
+    report["error_count"] += 1
+    # Отчет не растет бесконечно на заведомо битом файле
+    if len(report["errors"]) < settings.IMPORT_MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": number, "errors": errors})
+
+
+def write_import_batch(batch, owner, report):
+    with transaction.atomic():
+        courses = Course.objects.bulk_create(
+            Course(owner=owner, name=item["name"], description=item["description"])
+            for item in batch
+        )
+        lessons = Lesson.objects.bulk_create(
+            Lesson(course=course, owner=owner, **lesson)
+            for course, item in zip(courses, batch)
+            for lesson in item.get("lessons", [])
+        )
+    report["courses"] += len(courses)
+    report["lessons"] += len(lessons)
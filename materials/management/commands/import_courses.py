@@ -0,0 +1,43 @@
+import json
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from materials.importers import import_courses_ndjson
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Импорт курсов с уроками из NDJSON-файла (одна строка - один курс)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу или - для stdin")
+        parser.add_argument("--owner", required=True, help="Email владельца курсов")
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+
+        if options["path"] == "-":
+            report = import_courses_ndjson(
+                sys.stdin.buffer, owner, options["batch_size"]
+            )
+        else:
+            with open(options["path"], "rb") as lines:
+                report = import_courses_ndjson(lines, owner, options["batch_size"])
+
+        for error in report["errors"]:
+            self.stderr.write(
+                f"Строка {error['line']}: {json.dumps(error['errors'], ensure_ascii=False)}"
+            )
+        message = (
+            f"Строк: {report['lines']}, курсов: {report['courses']}, "
+            f"уроков: {report['lessons']}, ошибок: {report['error_count']}"
+        )
+        if report["error_count"]:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
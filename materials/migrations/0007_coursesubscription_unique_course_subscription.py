@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:00
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_subscriptions(apps, schema_editor):
+    CourseSubscription = apps.get_model("materials", "CourseSubscription")
+    keep_ids = (
+        CourseSubscription.objects.values("user", "course")
+        .annotate(keep_id=Min("id"))
+        .values("keep_id")
+    )
+    CourseSubscription.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_course_updated_at_lesson_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="coursesubscription",
+            constraint=models.UniqueConstraint(
+                fields=("user", "course"), name="unique_course_subscription"
+            ),
+        ),
+    ]
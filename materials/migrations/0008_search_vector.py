@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# Название весит больше описания, каждое поле разбирается и русской,
+# и английской конфигурацией
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION materials_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER materials_course_search_vector
+    BEFORE INSERT OR UPDATE OF name, description, search_vector ON materials_course
+    FOR EACH ROW EXECUTE FUNCTION materials_search_vector_update();
+CREATE TRIGGER materials_lesson_search_vector
+    BEFORE INSERT OR UPDATE OF name, description, search_vector ON materials_lesson
+    FOR EACH ROW EXECUTE FUNCTION materials_search_vector_update();
+
+UPDATE materials_course SET search_vector = NULL;
+UPDATE materials_lesson SET search_vector = NULL;
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER materials_course_search_vector ON materials_course;
+DROP TRIGGER materials_lesson_search_vector ON materials_lesson;
+DROP FUNCTION materials_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0007_coursesubscription_unique_course_subscription"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # Индексы строятся после заполнения векторов
+        migrations.RunSQL(SEARCH_VECTOR_SQL, DROP_SEARCH_VECTOR_SQL),
+        migrations.AddIndex(
+            model_name="course",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="course_search_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lesson",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="lesson_search_gin"
+            ),
+        ),
+    ]
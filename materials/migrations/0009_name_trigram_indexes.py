@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:00
+
+import logging
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEXES = [
+    (
+        "course",
+        django.contrib.postgres.indexes.GinIndex(
+            fields=["name"], name="course_name_trgm", opclasses=["gin_trgm_ops"]
+        ),
+    ),
+    (
+        "lesson",
+        django.contrib.postgres.indexes.GinIndex(
+            fields=["name"], name="lesson_name_trgm", opclasses=["gin_trgm_ops"]
+        ),
+    ),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            # Подсказки по названиям работают и без pg_trgm, но только
+            # по началу названия и без индекса
+            logger.warning("Расширение pg_trgm недоступно, индексы не созданы")
+            return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for model_name, index in TRIGRAM_INDEXES:
+        schema_editor.add_index(apps.get_model("materials", model_name), index)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    for _, index in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{index.name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0008_search_vector"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index)
+                for model_name, index in TRIGRAM_INDEXES
+            ],
+        ),
+    ]
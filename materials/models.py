@@ -1,9 +1,22 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import OperationalError, connections, models, router
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 
 from users.models import User
 
 
+class SearchVectorDeferredManager(models.Manager):
+    """Не загружает search_vector: колонка нужна только поиску в самой базе."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer("search_vector")
+
+
 class Course(models.Model):
     name = models.CharField(
         max_length=100,
@@ -33,17 +46,64 @@ class Course(models.Model):
         null=True,
         blank=True
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения",
+        help_text="Меняется при изменении курса и его уроков",
+    )
+    # Заполняется триггером в базе из name и description (миграция 0008)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchVectorDeferredManager()
 
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
+        indexes = [
+            GinIndex(fields=["search_vector"], name="course_search_gin"),
+            # Создается, только если в базе доступно расширение pg_trgm
+            # (миграция 0009)
+            GinIndex(
+                fields=["name"], name="course_name_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ]
+
+    @staticmethod
+    def notification_interval():
+        return timedelta(hours=settings.NOTIFICATION_INTERVAL_HOURS)
 
     def should_send_notification(self):
         if not self.last_notification_sent:
             return True
 
         time_since_last_notification = timezone.now() - self.last_notification_sent
-        return time_since_last_notification.total_seconds() > 4 * 60 * 60
+        return time_since_last_notification > self.notification_interval()
+
+    def next_notification_in_hours(self):
+        if not self.last_notification_sent:
+            return 0
+        next_at = self.last_notification_sent + self.notification_interval()
+        return max(0, (next_at - timezone.now()).total_seconds() / 3600)
+
+    def claim_notification(self):
+        """Атомарно занимает право на рассылку, возвращает True, если оно получено.
+
+        Проверка интервала и запись last_notification_sent выполняются одним
+        условным UPDATE, поэтому из параллельных воркеров рассылку
+        начинает только один.
+        """
+        now = timezone.now()
+        claimed = (
+            Course.objects.filter(pk=self.pk)
+            .filter(
+                Q(last_notification_sent__isnull=True)
+                | Q(last_notification_sent__lt=now - self.notification_interval())
+            )
+            .update(last_notification_sent=now)
+        )
+        if claimed:
+            self.last_notification_sent = now
+        return bool(claimed)
 
 
 class Lesson(models.Model):
@@ -79,11 +139,36 @@ class Lesson(models.Model):
         verbose_name="Владелец урока",
         help_text="Выберите владельца урока",
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения",
+        help_text="Дата изменения урока",
+    )
+    # Заполняется триггером в базе из name и description (миграция 0008)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchVectorDeferredManager()
 
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
         ordering = ["id"]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="lesson_search_gin"),
+            # Создается, только если в базе доступно расширение pg_trgm
+            # (миграция 0009)
+            GinIndex(
+                fields=["name"], name="lesson_name_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем курс на момент загрузки, чтобы при переносе урока
+        # сбросить кэш и старого курса
+        instance._loaded_course_id = instance.__dict__.get("course_id")
+        return instance
 
 
 class CourseSubscription(models.Model):
@@ -96,3 +181,107 @@ class CourseSubscription(models.Model):
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, verbose_name="Курс", help_text="Выберите курс"
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "course"], name="unique_course_subscription"
+            )
+        ]
+
+    TOGGLE_ATTEMPTS = 5
+
+    @classmethod
+    def toggle(cls, user_id, course_id):
+        """Переключает подписку одним запросом, возвращает (подписан, название курса).
+
+        DELETE ... RETURNING удаляет подписку, если она есть, иначе
+        INSERT ... ON CONFLICT DO NOTHING ее создает. Если курса нет,
+        название None и ничего не меняется. Ни удаления, ни вставки
+        бывает, когда параллельный запрос только что создал подписку, -
+        тогда запрос повторяется и удаляет ее, как при последовательном
+        выполнении.
+        """
+        subscriptions = cls._meta.db_table
+        courses = Course._meta.db_table
+        sql = f"""
+            WITH deleted AS (
+                DELETE FROM {subscriptions}
+                WHERE user_id = %(user_id)s AND course_id = %(course_id)s
+                RETURNING id
+            ), inserted AS (
+                INSERT INTO {subscriptions} (user_id, course_id)
+                SELECT %(user_id)s, %(course_id)s
+                WHERE NOT EXISTS (SELECT 1 FROM deleted)
+                    AND EXISTS (SELECT 1 FROM {courses} WHERE id = %(course_id)s)
+                ON CONFLICT (user_id, course_id) DO NOTHING
+                RETURNING id
+            )
+            SELECT
+                EXISTS (SELECT 1 FROM deleted),
+                EXISTS (SELECT 1 FROM inserted),
+                (SELECT name FROM {courses} WHERE id = %(course_id)s)
+        """
+        params = {"user_id": user_id, "course_id": course_id}
+        with connections[router.db_for_write(cls)].cursor() as cursor:
+            for _ in range(cls.TOGGLE_ATTEMPTS):
+                cursor.execute(sql, params)
+                deleted, inserted, course_name = cursor.fetchone()
+                if course_name is None or deleted or inserted:
+                    return inserted, course_name
+        raise OperationalError("Не удалось переключить подписку")
+
+    @classmethod
+    def bulk_set(cls, user_id, course_ids, subscribe):
+        """Подписывает или отписывает пользователя от курсов двумя запросами.
+
+        Возвращает словарь {course_id: статус}, статусы: subscribed,
+        already_subscribed, unsubscribed, not_subscribed, not_found.
+        """
+        course_ids = list(dict.fromkeys(course_ids))
+        # Существование курсов и текущие подписки - одним запросом с IN
+        subscribed = dict(
+            Course.objects.filter(id__in=course_ids)
+            .annotate(
+                subscribed=Exists(
+                    cls.objects.filter(user_id=user_id, course=OuterRef("pk"))
+                )
+            )
+            .values_list("id", "subscribed")
+        )
+
+        results = {}
+        for course_id in course_ids:
+            if course_id not in subscribed:
+                results[course_id] = "not_found"
+            elif subscribe:
+                if subscribed[course_id]:
+                    results[course_id] = "already_subscribed"
+                else:
+                    results[course_id] = "subscribed"
+            elif subscribed[course_id]:
+                results[course_id] = "unsubscribed"
+            else:
+                results[course_id] = "not_subscribed"
+
+        if subscribe:
+            # ignore_conflicts: подписку мог параллельно создать другой запрос
+            cls.objects.bulk_create(
+                [
+                    cls(user_id=user_id, course_id=course_id)
+                    for course_id, result in results.items()
+                    if result == "subscribed"
+                ],
+                ignore_conflicts=True,
+            )
+        else:
+            unsubscribe_ids = [
+                course_id
+                for course_id, result in results.items()
+                if result == "unsubscribed"
+            ]
+            if unsubscribe_ids:
+                cls.objects.filter(
+                    user_id=user_id, course_id__in=unsubscribe_ids
+                ).delete()
+        return results
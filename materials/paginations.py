@@ -1,7 +1,255 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Сколько секунд помнить число строк таблицы из pg_class
+TABLE_ROWS_CACHE_TIMEOUT = 60 * 5
+
+
+def estimate_table_rows(model, using):
+    """Число строк таблицы модели по pg_class.reltuples, кэшируется.
+
+    Для секционированной таблицы суммируются ее секции. Таблица, которую
+    еще не анализировали (reltuples = -1), считается пустой. Возвращает
+    None, если база не PostgreSQL.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+
+    table = model._meta.db_table
+    key = f"materials:table_rows:{using}:{table}"
+    rows = cache.get(key)
+    if rows is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0) FROM pg_class
+                WHERE relkind <> 'p' AND (
+                    oid = %s::regclass OR oid IN (
+                        SELECT relid FROM pg_partition_tree(%s::regclass)
+                        WHERE isleaf
+                    )
+                )
+                """,
+                [connection.ops.quote_name(table)] * 2,
+            )
+            rows = int(cursor.fetchone()[0])
+        cache.set(key, rows, TABLE_ROWS_CACHE_TIMEOUT)
+    return rows
+
+
+def estimate_count(queryset):
+    """Оценка числа строк планировщиком PostgreSQL.
+
+    Для запроса без фильтров EXPLAIN берет оценку из pg_class.reltuples,
+    для отфильтрованного - из статистики по колонкам. Возвращает None,
+    если база не PostgreSQL.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPage(Page):
+    def has_next(self):
+        if self.paginator.count_is_estimated:
+            # Оценка может быть меньше реального числа строк
+            return len(self.object_list) == self.paginator.per_page
+        return super().has_next()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который на больших выборках не делает COUNT(*)."""
+
+    _count_is_estimated = False
+
+    @cached_property
+    def count(self):
+        threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+        queryset = self.object_list
+        if hasattr(queryset, "query"):
+            # Если во всей таблице строк не больше порога, то и в выборке:
+            # EXPLAIN не нужен, сразу точный COUNT(*)
+            table_rows = estimate_table_rows(queryset.model, queryset.db)
+            if table_rows is not None and table_rows > threshold:
+                estimate = estimate_count(queryset)
+                if estimate is not None and estimate > threshold:
+                    self._count_is_estimated = True
+                    return estimate
+        return super().count
+
+    @property
+    def count_is_estimated(self):
+        return self.count is not None and self._count_is_estimated
+
+    def validate_number(self, number):
+        if not self.count_is_estimated:
+            return super().validate_number(number)
+        # Оценка может быть меньше реального числа строк,
+        # поэтому номер страницы сверху не ограничиваем
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimated:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom : bottom + self.per_page], number, self
+        )
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedCountPage(*args, **kwargs)
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = "page_size"
     max_page_size = 10
+
+
+class SubscriptionPagination(CustomPagination):
+    """Пагинация подписок: список отдается под ключом subscriptions."""
+
+    page_size = 20
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["subscriptions"] = response.data.pop("results")
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        properties = response_schema["properties"]
+        properties["subscriptions"] = properties.pop("results")
+        return response_schema
+
+
+class EstimatedCountPagination(CustomPagination):
+    """Пагинация по номеру страницы с оценочным count на больших таблицах.
+
+    Порог задается настройкой PAGINATION_COUNT_ESTIMATE_THRESHOLD, в ответе
+    флаг count_is_estimated показывает, точное ли значение count.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["count_is_estimated"] = self.page.paginator.count_is_estimated
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_is_estimated"] = {
+            "type": "boolean",
+            "example": False,
+        }
+        return response_schema
+
+
+class IteratorPagination(CustomPagination):
+    """Пагинация по номеру страницы для итератора, например строк архива.
+
+    Итератор читается только до конца запрошенной страницы, поэтому count
+    в ответе нет, а следующая страница определяется по одной лишней строке.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        start = (self.page_number - 1) * page_size
+        rows = list(islice(queryset, start, start + page_size + 1))
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        del response_schema["properties"]["count"]
+        response_schema["required"].remove("count")
+        return response_schema
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset-пагинация по id: без COUNT(*) и OFFSET, любая страница одинаково быстрая."""
+
+    ordering = "id"
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+def wants_keyset_pagination(request):
+    """Клиент включает keyset-режим параметром ?pagination=cursor или заголовком."""
+    if request.GET.get("pagination") == "cursor" or "cursor" in request.GET:
+        return True
+    return request.headers.get("X-Pagination") == "cursor"
+
+
+class PaginationModeMixin:
+    """Подменяет пагинатор вьюхи на keyset, если клиент его запросил."""
+
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            request = getattr(self, "request", None)
+            if request is not None and wants_keyset_pagination(request):
+                self._paginator = self.keyset_pagination_class()
+        return super().paginator
@@ -0,0 +1,101 @@
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.search import (SearchHeadline, SearchQuery,
+                                            SearchRank)
+from django.db.models import F, Value
+from django.db.models.functions import Replace
+
+from materials.models import Course, Lesson
+
+# Конфигурации те же, что в триггере search_vector (миграция 0008)
+SEARCH_CONFIGS = ("russian", "english")
+# Тип результата -> модель и поле с id курса
+SEARCH_MODELS = {
+    "course": (Course, "id"),
+    "lesson": (Lesson, "course_id"),
+}
+HEADLINE_OPTIONS = {
+    "config": "russian",
+    "start_sel": "<mark>",
+    "stop_sel": "</mark>",
+    "max_words": 35,
+    "min_words": 15,
+}
+
+
+def catalog_search_query(text):
+    """Запрос в синтаксисе websearch: слова, "фраза", -исключение, or."""
+    return reduce(
+        or_,
+        (
+            SearchQuery(text, config=config, search_type="websearch")
+            for config in SEARCH_CONFIGS
+        ),
+    )
+
+
+def escaped(field):
+    """Текст поля с экранированным HTML: в подсветке будут только теги <mark>."""
+    expression = F(field)
+    for char, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")):
+        expression = Replace(expression, Value(char), Value(entity))
+    return expression
+
+
+def search_catalog(text, types=None):
+    """Курсы и уроки, подходящие под запрос, по убыванию релевантности.
+
+    Совпадения отбираются по GIN-индексам search_vector, поэтому время
+    поиска зависит от числа совпадений, а не от размера каталога.
+    Подсветку для выбранной страницы добавляет add_highlights.
+    """
+    query = catalog_search_query(text)
+    querysets = [
+        model.objects.filter(search_vector=query)
+        .annotate(
+            type=Value(name),
+            course_ref=F(course_field),
+            rank=SearchRank(F("search_vector"), query),
+        )
+        .values("type", "id", "course_ref", "name", "rank")
+        .order_by()
+        for name, (model, course_field) in SEARCH_MODELS.items()
+        if not types or name in types
+    ]
+    results = querysets[0]
+    if len(querysets) > 1:
+        results = results.union(*querysets[1:], all=True)
+    return results.order_by("-rank", "type", "id")
+
+
+def add_highlights(rows, text):
+    """Добавляет к строкам результата подсветку совпадений в названии и описании.
+
+    ts_headline разбирает весь текст заново, поэтому считается одним
+    запросом на тип и только для строк страницы.
+    """
+    query = catalog_search_query(text)
+    highlights = {}
+    for name, (model, _) in SEARCH_MODELS.items():
+        ids = [row["id"] for row in rows if row["type"] == name]
+        if not ids:
+            continue
+        for item in (
+            model.objects.filter(id__in=ids)
+            .annotate(
+                name_highlight=SearchHeadline(
+                    escaped("name"), query, **HEADLINE_OPTIONS
+                ),
+                description_highlight=SearchHeadline(
+                    escaped("description"), query, **HEADLINE_OPTIONS
+                ),
+            )
+            .values("id", "name_highlight", "description_highlight")
+            .order_by()
+        ):
+            highlights[name, item.pop("id")] = item
+
+    for row in rows:
+        row.update(highlights.get((row["type"], row["id"]), {}))
+    return rows
@@ -2,6 +2,8 @@ from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
 from materials.models import Course, CourseSubscription, Lesson
+from materials.search import SEARCH_MODELS
+from materials.typeahead import TYPEAHEAD_MAX_LIMIT, TYPEAHEAD_MIN_LENGTH
 from materials.validators import validate_link
 
 
@@ -9,12 +11,16 @@ class CourseSerializer(serializers.ModelSerializer):
     count_lessons_in_course = serializers.SerializerMethodField()
     lessons = SerializerMethodField()
 
-    def get_count_of_lessons_in_course(self, obj):
-        return Lesson.objects.filter(course=obj).count()
+    def get_count_lessons_in_course(self, obj):
+        # Во вьюсете количество посчитано через annotate, без запроса на курс
+        lessons_count = getattr(obj, "lessons_count", None)
+        if lessons_count is None:
+            lessons_count = obj.lesson_set.count()
+        return lessons_count
 
     def get_lessons(self, obj):
-        lessons = Lesson.objects.filter(course=obj)
-        return LessonSerializer(lessons, many=True).data
+        # lesson_set.all() берет уроки из prefetch_related, если он был
+        return LessonSerializer(obj.lesson_set.all(), many=True).data
 
     class Meta:
         model = Course
@@ -25,12 +31,14 @@ class CourseDetailSerializer(serializers.ModelSerializer):
     count_lessons_in_course = serializers.SerializerMethodField()
     lessons = serializers.SerializerMethodField()
 
-    def get_count_of_lessons_in_course(self, obj):
-        return Lesson.objects.filter(course=obj).count()
+    def get_count_lessons_in_course(self, obj):
+        lessons_count = getattr(obj, "lessons_count", None)
+        if lessons_count is None:
+            lessons_count = obj.lesson_set.count()
+        return lessons_count
 
     def get_lessons(self, obj):
-        lessons = Lesson.objects.filter(course=obj)
-        return LessonSerializer(lessons, many=True).data
+        return LessonSerializer(obj.lesson_set.all(), many=True).data
 
     class Meta:
         model = Course
@@ -44,14 +52,122 @@ class LessonSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Lesson
-        fields = "__all__"
+        exclude = ("search_vector",)
+
+
+class BulkCourseField(serializers.PrimaryKeyRelatedField):
+    """Берет курс из context["courses"], загруженного для всего списка одним запросом."""
+
+    def to_internal_value(self, data):
+        courses = self.context.get("courses")
+        if courses is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return courses[int(data)]
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+
+
+class LessonBulkListSerializer(serializers.ListSerializer):
+    """Список уроков для массовых операций.
+
+    При обновлении instance - словарь {id: урок}, каждый элемент данных
+    валидируется против своего урока.
+    """
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            lesson_id = data.get("id") if isinstance(data, dict) else None
+            lesson = self.instance.get(lesson_id)
+            if lesson is None:
+                raise serializers.ValidationError({"id": "Урок не найден"})
+            self.child.instance = lesson
+            self.child.initial_data = data
+        return super().run_child_validation(data)
+
+
+class LessonBulkSerializer(LessonSerializer):
+    id = serializers.IntegerField(required=False)
+    course = BulkCourseField(queryset=Course.objects.all())
+
+    class Meta(LessonSerializer.Meta):
+        read_only_fields = ["owner"]
+        list_serializer_class = LessonBulkListSerializer
+
+
+class LessonBulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1
+    )
+
+
+class LessonImportSerializer(LessonSerializer):
+    """Урок в строке импорта: курс и владелец задаются импортом."""
+
+    class Meta:
+        model = Lesson
+        fields = ("name", "description", "url")
+
+
+class CourseImportSerializer(serializers.ModelSerializer):
+    lessons = LessonImportSerializer(many=True, required=False)
+
+    class Meta:
+        model = Course
+        fields = ("name", "description", "lessons")
 
 
 class CourseSubscriptionSerializer(serializers.ModelSerializer):
-    course_title = serializers.CharField(source="course.title", read_only=True)
+    course_name = serializers.CharField(source="course.name", read_only=True)
     user_email = serializers.CharField(source="user.email", read_only=True)
 
     class Meta:
         model = CourseSubscription
-        fields = ["id", "user", "course", "course_title", "user_email"]
+        fields = ["id", "user", "course", "course_name", "user_email"]
         read_only_fields = ["id"]
+
+
+class CourseSubscriptionBulkSerializer(serializers.Serializer):
+    SUBSCRIBE = "subscribe"
+    UNSUBSCRIBE = "unsubscribe"
+
+    course_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=100
+    )
+    action = serializers.ChoiceField(choices=[SUBSCRIBE, UNSUBSCRIBE])
+
+
+class CatalogSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    type = serializers.ChoiceField(choices=list(SEARCH_MODELS), required=False)
+
+
+class CatalogSearchResultSerializer(serializers.Serializer):
+    """Результат поиска, совпадения в подсветке обрамлены тегами <mark>."""
+
+    type = serializers.CharField(read_only=True)
+    id = serializers.IntegerField(read_only=True)
+    course = serializers.IntegerField(source="course_ref", read_only=True)
+    name = serializers.CharField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+    name_highlight = serializers.CharField(read_only=True)
+    description_highlight = serializers.CharField(read_only=True)
+
+
+class TypeaheadQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=TYPEAHEAD_MIN_LENGTH, max_length=100)
+    type = serializers.ChoiceField(choices=list(SEARCH_MODELS), required=False)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=TYPEAHEAD_MAX_LIMIT, required=False
+    )
+
+
+class TypeaheadResultSerializer(serializers.Serializer):
+    type = serializers.CharField(read_only=True)
+    id = serializers.IntegerField(read_only=True)
+    course = serializers.IntegerField(source="course_ref", read_only=True)
+    name = serializers.CharField(read_only=True)
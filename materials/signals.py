@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from materials.cache import bump_course_version
+from materials.models import Course, Lesson
+
+
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_course_cache(sender, instance, **kwargs):
+    bump_course_version(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Lesson)
+def invalidate_lesson_course_cache(sender, instance, **kwargs):
+    # При переносе урока устаревают ответы и старого, и нового курса
+    course_ids = {instance.course_id, getattr(instance, "_loaded_course_id", None)}
+    course_ids.discard(None)
+
+    # updated_at курса служит валидатором для ETag вместе с уроками
+    Course.objects.filter(pk__in=course_ids).update(updated_at=timezone.now())
+    for course_id in course_ids:
+        bump_course_version(course_id)
@@ -1,42 +1,268 @@
-from celery import shared_task
-from django.core.mail import send_mail
+import logging
+from itertools import islice
+
+from celery import chord, shared_task
+from celery.utils import uuid
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 from django.utils import timezone
 from .models import CourseSubscription, Course
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def send_course_update_notification(course_id):
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_subscriber_email_chunks(course_id, chunk_size, first_id=None, last_id=None):
+    """Почты подписчиков курса пачками, без загрузки подписок и пользователей в память."""
+    subscriptions = CourseSubscription.objects.filter(course_id=course_id)
+    if first_id is not None:
+        subscriptions = subscriptions.filter(id__gte=first_id, id__lte=last_id)
+    emails = subscriptions.values_list("user__email", flat=True).iterator(
+        chunk_size=chunk_size
+    )
+    return chunked(emails, chunk_size)
+
+
+def subscription_id_ranges(course_id, shard_size):
+    """Границы шардов подписчиков курса: пары (первый id, последний id)."""
+    ids = (
+        CourseSubscription.objects.filter(course_id=course_id)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=shard_size)
+    )
+    return [(shard[0], shard[-1]) for shard in chunked(ids, shard_size)]
+
+
+def send_course_update_emails(course, emails, connection):
+    """Отправляет письма пачки через общее SMTP-соединение, возвращает (sent, failed)."""
+    messages = [
+        EmailMessage(
+            "Курс обновлен",
+            f"Курс '{course.name}' обновлен",
+            settings.DEFAULT_FROM_EMAIL,
+            [email],
+            connection=connection,
+        )
+        for email in emails
+    ]
+    # С fail_silently=True backend возвращает число успешно отправленных писем
+    sent = connection.send_messages(messages) or 0
+    return sent, len(messages) - sent
+
+
+def notification_progress_key(course_id, field):
+    return f"materials:notification:{course_id}:{field}"
+
+
+PROGRESS_FIELDS = (
+    "status",
+    "shards_total",
+    "shards_done",
+    "sent",
+    "failed",
+    "started_at",
+    "finished_at",
+)
+
+
+def start_notification_progress(course_id, shards_total):
+    cache.delete_many(
+        [notification_progress_key(course_id, field) for field in PROGRESS_FIELDS]
+    )
+    cache.set_many(
+        {
+            notification_progress_key(course_id, "status"): "running",
+            notification_progress_key(course_id, "shards_total"): shards_total,
+            notification_progress_key(course_id, "shards_done"): 0,
+            notification_progress_key(course_id, "sent"): 0,
+            notification_progress_key(course_id, "failed"): 0,
+            notification_progress_key(course_id, "started_at"): timezone.now(),
+        },
+        settings.NOTIFICATION_PROGRESS_TIMEOUT,
+    )
+
+
+def add_notification_progress(course_id, **deltas):
+    for field, delta in deltas.items():
+        try:
+            cache.incr(notification_progress_key(course_id, field), delta)
+        except ValueError:
+            # Прогресс истек или был сброшен - рассылку это не останавливает
+            pass
+
+
+def get_notification_progress(course_id):
+    """Прогресс последней рассылки курса или None, если ее не было."""
+    values = cache.get_many(
+        [notification_progress_key(course_id, field) for field in PROGRESS_FIELDS]
+    )
+    if not values:
+        return None
+    return {
+        field: values.get(notification_progress_key(course_id, field))
+        for field in PROGRESS_FIELDS
+    }
+
+
+def pending_notification_key(course_id):
+    return f"materials:notification:{course_id}:pending"
+
+
+def get_pending_notification(course_id):
+    """id задачи рассылки, которая ждет запуска, или None."""
+    return cache.get(pending_notification_key(course_id))
+
+
+def enqueue_course_update_notification(course_id):
+    """Ставит рассылку об обновлении курса, не более одной ожидающей на курс.
+
+    Задача запускается через NOTIFICATION_COALESCE_WINDOW секунд, обновления
+    курса за это время сливаются в нее. Возвращает id ожидающей задачи.
+    """
+    window = settings.NOTIFICATION_COALESCE_WINDOW
+    if not window:
+        return send_course_update_notification.delay(course_id).id
+
+    key = pending_notification_key(course_id)
+    task_id = uuid()
+    # Ключ живет дольше окна, чтобы не истечь раньше запуска задачи
+    if not cache.add(key, task_id, timeout=window * 2):
+        logger.info(f"Обновление курса {course_id} слито с ожидающей рассылкой")
+        return cache.get(key)
+
+    try:
+        send_course_update_notification.apply_async(
+            (course_id,), task_id=task_id, countdown=window
+        )
+    except Exception:
+        cache.delete(key)
+        raise
+    return task_id
+
+
+def release_pending_notification(course_id, task_id):
+    key = pending_notification_key(course_id)
+    if cache.get(key) == task_id:
+        cache.delete(key)
+
+
+def skipped_by_interval(course):
+    return {
+        "status": "skipped",
+        "message": f"Уведомление для курса '{course.name}' не отправлено - прошло менее {settings.NOTIFICATION_INTERVAL_HOURS} ч. с предыдущего уведомления",
+    }
+
+
+@shared_task(bind=True)
+def send_course_update_notification(self, course_id):
+    """Раскладывает подписчиков курса на шарды и рассылает их параллельно.
+
+    Шарды выполняются группой задач на всех воркерах, итог собирает
+    callback аккорда finish_course_update_notification.
+    """
+    # Обновления, пришедшие после запуска, поставят новую задачу
+    release_pending_notification(course_id, self.request.id)
     try:
         course = Course.objects.get(id=course_id)
 
         if not course.should_send_notification():
-            return f"Уведомление для курса '{course.name}' не отправлено - прошло менее 4 часов с предыдущего уведомления"
-
-        subscriptions = CourseSubscription.objects.filter(course=course)
+            return skipped_by_interval(course)
 
-        if not subscriptions.exists():
-            return f"Нет подписчиков для курса '{course.name}'"
+        id_ranges = subscription_id_ranges(course.id, settings.NOTIFICATION_SHARD_SIZE)
+        if not id_ranges:
+            return {
+                "status": "skipped",
+                "message": f"Нет подписчиков для курса '{course.name}'",
+            }
 
-        email_count = 0
-        for subscription in subscriptions:
-            try:
-                send_mail_update_course([subscription.user.email])
-                email_count += 1
-            except Exception as e:
-                print(f"Ошибка отправки для {subscription.user.email}: {str(e)}")
+        previous_sent = course.last_notification_sent
+        # Параллельный воркер мог начать рассылку после проверки выше
+        if not course.claim_notification():
+            return skipped_by_interval(course)
 
-        course.last_notification_sent = timezone.now()
-        course.save()
+        start_notification_progress(course.id, len(id_ranges))
+        try:
+            result = chord(
+                send_course_update_shard.s(course.id, first_id, last_id)
+                for first_id, last_id in id_ranges
+            )(finish_course_update_notification.s(course.id))
+        except Exception:
+            # Рассылка не запущена - возвращаем право на нее
+            Course.objects.filter(
+                pk=course.pk, last_notification_sent=course.last_notification_sent
+            ).update(last_notification_sent=previous_sent)
+            raise
 
-        return f"Уведомления отправлены {email_count} подписчикам курса '{course.name}'"
+        return {
+            "status": "started",
+            "message": f"Рассылка по курсу '{course.name}' запущена",
+            "shards": len(id_ranges),
+            "chord_id": result.id,
+        }
 
     except Course.DoesNotExist:
-        return f"Курс с id {course_id} не найден"
+        return {"status": "error", "message": f"Курс с id {course_id} не найден"}
     except Exception as e:
-        return f"Ошибка при отправке уведомлений: {str(e)}"
+        logger.error(f"Ошибка в задаче send_course_update_notification: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"Ошибка при отправке уведомлений: {str(e)}",
+        }
 
 
 @shared_task
-def send_mail_update_course(email):
-    send_mail('Курс обновлен', 'Курс обновлен', settings.EMAIL_HOST_USER, [email])
+def send_course_update_shard(course_id, first_id, last_id):
+    """Рассылает письма подписчикам одного шарда через одно SMTP-соединение."""
+    course = Course.objects.only("id", "name").get(id=course_id)
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=True)
+    connection.open()
+    try:
+        for emails in iter_subscriber_email_chunks(
+            course.id, settings.NOTIFICATION_CHUNK_SIZE, first_id, last_id
+        ):
+            chunk_sent, chunk_failed = send_course_update_emails(
+                course, emails, connection
+            )
+            sent += chunk_sent
+            failed += chunk_failed
+            add_notification_progress(course.id, sent=chunk_sent, failed=chunk_failed)
+            logger.info(
+                f"Курс {course.id}, шард {first_id}-{last_id}: отправлено {chunk_sent}, ошибок {chunk_failed}"
+            )
+    finally:
+        connection.close()
+
+    add_notification_progress(course.id, shards_done=1)
+    return {"sent": sent, "failed": failed}
+
+
+@shared_task
+def finish_course_update_notification(results, course_id):
+    sent = sum(result["sent"] for result in results)
+    failed = sum(result["failed"] for result in results)
+
+    # last_notification_sent уже записан при захвате рассылки
+    cache.set_many(
+        {
+            notification_progress_key(course_id, "status"): "done",
+            notification_progress_key(course_id, "finished_at"): timezone.now(),
+        },
+        settings.NOTIFICATION_PROGRESS_TIMEOUT,
+    )
+
+    return {
+        "status": "success",
+        "message": f"Уведомления отправлены {sent} подписчикам курса {course_id}",
+        "sent": sent,
+        "failed": failed,
+        "shards": len(results),
+    }
@@ -1,11 +1,43 @@
+import csv
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
 from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from config.celery import app as celery_app
+from materials.cache import get_course_version, get_response_cache_stats
+from materials.importers import import_courses_ndjson
 from materials.models import Course, CourseSubscription, Lesson
-from materials.serializers import CourseSubscriptionSerializer
-from users.models import User
+from materials.search import catalog_search_query
+from materials.serializers import (CourseSubscriptionSerializer,
+                                   LessonSerializer)
+from materials.tasks import (enqueue_course_update_notification,
+                             finish_course_update_notification,
+                             get_notification_progress,
+                             get_pending_notification,
+                             release_pending_notification,
+                             send_course_update_notification,
+                             send_course_update_shard, subscription_id_ranges)
+from materials.typeahead import trigram_available
+from users.models import Payment, User
+from users.serializers import PaymentSerializer
 
 
 class LessonCreateAPIViewTestCase(APITestCase):
@@ -630,6 +662,38 @@ class CourseSubscriptionGetTests(CourseSubscriptionAPITestCase):
         self.assertEqual(response.data["count"], 1)
         self.assertEqual(response.data["subscriptions"][0]["course"], self.course.id)
 
+    def test_get_subscriptions_with_course_name(self):
+        CourseSubscription.objects.create(user=self.user, course=self.course)
+
+        self.authenticate_user()
+        response = self.client.get(self.url)
+
+        subscription = response.data["subscriptions"][0]
+        self.assertEqual(subscription["course_name"], self.course.name)
+        self.assertEqual(subscription["user_email"], self.user.email)
+
+    def test_get_subscriptions_constant_queries(self):
+        """Число запросов не зависит от числа подписок"""
+        courses = Course.objects.bulk_create(
+            Course(name=f"Курс {i}", owner=self.user) for i in range(30)
+        )
+        CourseSubscription.objects.bulk_create(
+            CourseSubscription(user=self.user, course=course) for course in courses
+        )
+        self.authenticate_user()
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data["count"], 30)
+        self.assertEqual(len(response.data["subscriptions"]), 20)
+        self.assertIsNotNone(response.data["next"])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(len(response.data["subscriptions"]), 10)
+
     def test_get_unauthenticated(self):
         """Тест неаутентифицированного GET запроса"""
         response = self.client.get(self.url)
@@ -671,3 +735,1355 @@ class CourseSubscriptionToggleTests(CourseSubscriptionAPITestCase):
                 user=self.user, course=self.course
             ).exists()
         )
+
+    def test_toggle_is_one_query(self):
+        self.authenticate_user()
+
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, {"course_id": self.course.id})
+
+        self.assertTrue(response.data["subscription_status"])
+
+    def test_duplicate_subscription_rejected(self):
+        CourseSubscription.objects.create(user=self.user, course=self.course)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CourseSubscription.objects.create(user=self.user, course=self.course)
+
+
+class ConcurrentSubscriptionToggleTestCase(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.user = User.objects.create(email="user@test.com")
+        self.course = Course.objects.create(name="Курс", owner=self.user)
+
+    def toggle_concurrently(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(CourseSubscription.toggle(self.user.pk, self.course.pk))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_toggles_apply_in_order(self):
+        """Параллельные переключения не создают дублей и дают тот же итог,
+        что и последовательные"""
+        results = self.toggle_concurrently()
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(
+            sum(subscribed for subscribed, _ in results), self.THREADS // 2
+        )
+        self.assertFalse(
+            CourseSubscription.objects.filter(
+                user=self.user, course=self.course
+            ).exists()
+        )
+
+    def test_concurrent_toggles_from_subscribed(self):
+        CourseSubscription.objects.create(user=self.user, course=self.course)
+        self.THREADS = 7
+
+        self.toggle_concurrently()
+
+        self.assertEqual(
+            CourseSubscription.objects.filter(
+                user=self.user, course=self.course
+            ).count(),
+            0,
+        )
+
+
+class CourseListQueryCountTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@test.com")
+        self.url = reverse("materials:course-list")
+        self.client.force_authenticate(user=self.user)
+
+    def create_courses(self, courses_count, lessons_per_course):
+        for i in range(courses_count):
+            course = Course.objects.create(
+                name=f"Курс {i}", description="Описание", owner=self.user
+            )
+            Lesson.objects.bulk_create(
+                Lesson(name=f"Урок {j}", course=course, owner=self.user)
+                for j in range(lessons_per_course)
+            )
+
+    def test_course_list_query_count_is_fixed(self):
+        """Количество запросов не зависит от числа курсов и уроков на странице"""
+        # Размер таблицы курсов читается из pg_class один раз и кэшируется
+        cache.clear()
+        self.create_courses(courses_count=1, lessons_per_course=1)
+        self.client.get(self.url)
+
+        # COUNT(*), курсы, уроки
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.create_courses(courses_count=4, lessons_per_course=7)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(response.data["results"][1]["count_lessons_in_course"], 7)
+        self.assertEqual(len(response.data["results"][1]["lessons"]), 7)
+
+    def test_course_retrieve_query_count_is_fixed(self):
+        """Детальный просмотр курса не делает запрос на каждый урок"""
+        self.create_courses(courses_count=1, lessons_per_course=1)
+        self.create_courses(courses_count=1, lessons_per_course=10)
+        small_course, big_course = Course.objects.order_by("id")
+
+        # Оба запроса с пустым кэшем, чтобы сравнивать сборку ответа
+        cache.clear()
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.get(
+                reverse("materials:course-detail", kwargs={"pk": small_course.pk})
+            )
+        cache.clear()
+        with CaptureQueriesContext(connection) as big_queries:
+            response = self.client.get(
+                reverse("materials:course-detail", kwargs={"pk": big_course.pk})
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count_lessons_in_course"], 10)
+        self.assertEqual(len(big_queries), len(small_queries))
+
+
+class KeysetPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        self.lessons = Lesson.objects.bulk_create(
+            Lesson(name=f"Урок {i}", course=self.course, owner=self.user)
+            for i in range(7)
+        )
+        self.url = reverse("materials:lesson_list")
+        self.client.force_authenticate(user=self.user)
+
+    def test_page_number_pagination_by_default(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 7)
+
+    def test_keyset_pagination_by_query_param(self):
+        """Клиент проходит все уроки по курсору, без COUNT(*)"""
+        response = self.client.get(self.url, {"pagination": "cursor", "page_size": 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        ids = [lesson["id"] for lesson in response.data["results"]]
+
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            ids += [lesson["id"] for lesson in response.data["results"]]
+
+        self.assertEqual(ids, [lesson.id for lesson in self.lessons])
+
+    def test_keyset_pagination_by_header(self):
+        response = self.client.get(self.url, HTTP_X_PAGINATION="cursor")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_keyset_pagination_allows_large_pages(self):
+        response = self.client.get(self.url, {"pagination": "cursor", "page_size": 500})
+
+        self.assertEqual(len(response.data["results"]), 7)
+        self.assertIsNone(response.data["next"])
+
+    def test_keyset_pagination_on_courses(self):
+        response = self.client.get(
+            reverse("materials:course-list"), {"pagination": "cursor"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(response.data["results"][0]["count_lessons_in_course"], 7)
+
+
+class EstimatedCountPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        Lesson.objects.bulk_create(
+            Lesson(name=f"Урок {i}", course=self.course, owner=self.user)
+            for i in range(7)
+        )
+        self.url = reverse("materials:lesson_list")
+        self.client.force_authenticate(user=self.user)
+        # reltuples заполняется при ANALYZE
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE materials_lesson")
+        cache.clear()
+
+    def test_exact_count_below_threshold(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 7)
+        self.assertFalse(response.data["count_is_estimated"])
+
+    def test_small_table_skips_explain(self):
+        """Таблица меньше порога: EXPLAIN не выполняется, размер кэшируется"""
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data["count"], 7)
+        self.assertFalse(any("EXPLAIN" in query["sql"] for query in first))
+        self.assertTrue(any("pg_class" in query["sql"] for query in first))
+        self.assertFalse(any("pg_class" in query["sql"] for query in second))
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_estimated_count_above_threshold(self):
+        """Выше порога count берется из EXPLAIN, COUNT(*) не выполняется"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["count_is_estimated"])
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIsNotNone(response.data["next"])
+        self.assertFalse(any("COUNT(*)" in query["sql"] for query in queries))
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_estimated_count_last_page(self):
+        """Последняя страница определяется по данным, а не по оценке"""
+        response = self.client.get(self.url, {"page": 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+
+
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="owner@test.com")
+        self.admin = User.objects.create(email="admin@test.com", is_staff=True)
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        self.other_course = Course.objects.create(
+            name="Другой курс", description="Описание", owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            name="Урок", course=self.course, owner=self.user
+        )
+        self.course_url = reverse(
+            "materials:course-detail", kwargs={"pk": self.course.pk}
+        )
+        self.lesson_url = reverse(
+            "materials:lesson_retrieve", kwargs={"pk": self.lesson.pk}
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_repeated_retrieve_is_served_from_cache(self):
+        self.client.get(self.course_url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.course_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["lessons"][0]["name"], "Урок")
+        self.assertFalse(
+            any("materials_lesson" in query["sql"] for query in queries)
+        )
+        self.assertEqual(get_response_cache_stats()["hits"], 1)
+        self.assertEqual(get_response_cache_stats()["misses"], 1)
+
+    def test_course_update_invalidates_cache(self):
+        self.client.get(self.course_url)
+
+        self.client.patch(self.course_url, {"name": "Новое название"})
+        response = self.client.get(self.course_url)
+
+        self.assertEqual(response.data["name"], "Новое название")
+
+    def test_lesson_update_invalidates_course_cache(self):
+        self.client.get(self.course_url)
+        self.client.get(self.lesson_url)
+
+        update_url = reverse("materials:lesson_update", kwargs={"pk": self.lesson.pk})
+        self.client.patch(update_url, {"name": "Новый урок"})
+
+        self.assertEqual(
+            self.client.get(self.course_url).data["lessons"][0]["name"], "Новый урок"
+        )
+        self.assertEqual(self.client.get(self.lesson_url).data["name"], "Новый урок")
+
+    def test_lesson_move_invalidates_both_courses(self):
+        other_course_url = reverse(
+            "materials:course-detail", kwargs={"pk": self.other_course.pk}
+        )
+        self.client.get(self.course_url)
+        self.client.get(other_course_url)
+
+        lesson = Lesson.objects.get(pk=self.lesson.pk)
+        lesson.course = self.other_course
+        lesson.save()
+
+        self.assertEqual(self.client.get(self.course_url).data["lessons"], [])
+        self.assertEqual(len(self.client.get(other_course_url).data["lessons"]), 1)
+
+    def test_lesson_delete_invalidates_course_cache(self):
+        self.client.get(self.course_url)
+
+        self.lesson.delete()
+
+        self.assertEqual(
+            self.client.get(self.course_url).data["count_lessons_in_course"], 0
+        )
+
+    def test_cached_retrieve_still_checks_permissions(self):
+        self.client.get(self.course_url)
+        self.client.force_authenticate(
+            user=User.objects.create(email="other@test.com")
+        )
+
+        response = self.client.get(self.course_url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cache_stats_for_admin_only(self):
+        url = reverse("materials:cache_stats")
+        self.client.get(self.course_url)
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["misses"], 1)
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="owner@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            name="Урок", course=self.course, owner=self.user
+        )
+        self.course_url = reverse(
+            "materials:course-detail", kwargs={"pk": self.course.pk}
+        )
+        self.lesson_url = reverse(
+            "materials:lesson_retrieve", kwargs={"pk": self.lesson.pk}
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_retrieve_not_modified(self):
+        """Повторный запрос с ETag получает 304 без загрузки уроков"""
+        etag = self.client.get(self.course_url)["ETag"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.course_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(
+            any("materials_lesson" in query["sql"] for query in queries)
+        )
+
+    def test_lesson_update_changes_course_etag(self):
+        etag = self.client.get(self.course_url)["ETag"]
+
+        self.client.patch(
+            reverse("materials:lesson_update", kwargs={"pk": self.lesson.pk}),
+            {"name": "Новый урок"},
+        )
+        response = self.client.get(self.course_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["lessons"][0]["name"], "Новый урок")
+
+    def test_lesson_retrieve_not_modified_since(self):
+        last_modified = self.client.get(self.lesson_url)["Last-Modified"]
+
+        response = self.client.get(
+            self.lesson_url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_lesson_list_not_modified_until_lesson_added(self):
+        url = reverse("materials:lesson_list")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Lesson.objects.create(name="Еще урок", course=self.course, owner=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+
+    def test_course_list_not_modified_skips_page_load(self):
+        """При совпавшем ETag загружаются только id и updated_at страницы"""
+        url = reverse("materials:course-list")
+        etag = self.client.get(url)["ETag"]
+
+        # COUNT(*) и id с updated_at страницы, без уроков
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_list_changed_etag_returns_full_page(self):
+        url = reverse("materials:course-list")
+        etag = self.client.get(url)["ETag"]
+        Lesson.objects.create(name="Еще урок", course=self.course, owner=self.user)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["results"][0]["count_lessons_in_course"], 2)
+        self.assertEqual(len(response.data["results"][0]["lessons"]), 2)
+
+    def test_keyset_list_not_modified(self):
+        url = reverse("materials:lesson_list")
+        etag = self.client.get(url, {"pagination": "cursor"})["ETag"]
+
+        response = self.client.get(
+            url, {"pagination": "cursor"}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_list_etag_depends_on_page(self):
+        url = reverse("materials:course-list")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, {"page_size": 1}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CourseUpdateNotificationTaskTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.owner
+        )
+        subscribers = User.objects.bulk_create(
+            User(email=f"subscriber{i}@test.com") for i in range(5)
+        )
+        CourseSubscription.objects.bulk_create(
+            CourseSubscription(user=user, course=self.course) for user in subscribers
+        )
+
+    def run_tasks_eagerly(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+    @override_settings(NOTIFICATION_CHUNK_SIZE=2)
+    def test_shard_emails_sent_in_chunks(self):
+        """Почты шарда читаются одним запросом и уходят пачками"""
+        ids = list(
+            CourseSubscription.objects.order_by("id").values_list("id", flat=True)
+        )
+
+        with self.assertNumQueries(2):
+            result = send_course_update_shard(self.course.id, ids[0], ids[-1])
+
+        self.assertEqual(result, {"sent": 5, "failed": 0})
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f"subscriber{i}@test.com" for i in range(5)],
+        )
+
+    @override_settings(NOTIFICATION_SHARD_SIZE=2)
+    def test_subscribers_split_into_shards(self):
+        ids = list(
+            CourseSubscription.objects.order_by("id").values_list("id", flat=True)
+        )
+
+        self.assertEqual(
+            subscription_id_ranges(self.course.id, 2),
+            [(ids[0], ids[1]), (ids[2], ids[3]), (ids[4], ids[4])],
+        )
+
+    @override_settings(NOTIFICATION_SHARD_SIZE=2, NOTIFICATION_CHUNK_SIZE=1)
+    def test_fan_out_aggregates_shards(self):
+        """Шарды рассылаются аккордом, callback собирает итог и прогресс"""
+        self.run_tasks_eagerly()
+
+        result = send_course_update_notification(self.course.id)
+
+        self.assertEqual(result["status"], "started")
+        self.assertEqual(result["shards"], 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.course.refresh_from_db()
+        self.assertIsNotNone(self.course.last_notification_sent)
+
+        progress = get_notification_progress(self.course.id)
+        self.assertEqual(progress["status"], "done")
+        self.assertEqual(progress["shards_total"], 3)
+        self.assertEqual(progress["shards_done"], 3)
+        self.assertEqual(progress["sent"], 5)
+        self.assertEqual(progress["failed"], 0)
+
+    def test_finish_sums_shard_results(self):
+        result = finish_course_update_notification(
+            [{"sent": 2, "failed": 0}, {"sent": 1, "failed": 1}], self.course.id
+        )
+
+        self.assertEqual(result["sent"], 3)
+        self.assertEqual(result["failed"], 1)
+        self.assertEqual(result["shards"], 2)
+
+    def test_notification_status_shows_progress(self):
+        self.run_tasks_eagerly()
+        send_course_update_notification(self.course.id)
+        self.client.force_authenticate(user=self.owner)
+
+        response = self.client.get(
+            reverse("materials:course-notification-status", args=(self.course.id,))
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["progress"]["status"], "done")
+        self.assertEqual(response.json()["progress"]["sent"], 5)
+
+    def test_course_without_subscribers(self):
+        CourseSubscription.objects.all().delete()
+
+        result = send_course_update_notification(self.course.id)
+
+        self.assertEqual(result["status"], "skipped")
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class NotificationCoalescingTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(email="owner@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.owner
+        )
+        self.lessons = Lesson.objects.bulk_create(
+            Lesson(name=f"Урок {i}", course=self.course, owner=self.owner)
+            for i in range(3)
+        )
+        self.client.force_authenticate(user=self.owner)
+        patcher = patch.object(send_course_update_notification, "apply_async")
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_updates_in_window_enqueue_one_task(self):
+        """Серия правок курса и уроков ставит одну отложенную рассылку"""
+        self.client.patch(
+            reverse("materials:course-detail", args=(self.course.id,)),
+            {"name": "Новое название"},
+        )
+        for lesson in self.lessons:
+            self.client.patch(
+                reverse("materials:lesson_update", args=(lesson.id,)),
+                {"name": "Новый урок"},
+            )
+
+        self.apply_async.assert_called_once()
+        args, kwargs = self.apply_async.call_args
+        self.assertEqual(args, ((self.course.id,),))
+        self.assertEqual(kwargs["countdown"], settings.NOTIFICATION_COALESCE_WINDOW)
+        self.assertEqual(get_pending_notification(self.course.id), kwargs["task_id"])
+
+    def test_started_task_releases_pending_slot(self):
+        task_id = enqueue_course_update_notification(self.course.id)
+        release_pending_notification(self.course.id, task_id)
+
+        self.assertNotEqual(enqueue_course_update_notification(self.course.id), task_id)
+        self.assertEqual(self.apply_async.call_count, 2)
+
+    def test_other_task_does_not_release_pending_slot(self):
+        task_id = enqueue_course_update_notification(self.course.id)
+        release_pending_notification(self.course.id, "other")
+
+        self.assertEqual(get_pending_notification(self.course.id), task_id)
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW=0)
+    def test_zero_window_enqueues_immediately(self):
+        with patch.object(send_course_update_notification, "delay") as delay:
+            enqueue_course_update_notification(self.course.id)
+            enqueue_course_update_notification(self.course.id)
+
+        self.assertEqual(delay.call_count, 2)
+        self.apply_async.assert_not_called()
+
+
+class NotificationClaimTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.owner
+        )
+
+    def test_only_one_concurrent_claim_wins(self):
+        """Оба воркера видят, что рассылать можно, но право получает один"""
+        first = Course.objects.get(pk=self.course.pk)
+        second = Course.objects.get(pk=self.course.pk)
+        self.assertTrue(first.should_send_notification())
+        self.assertTrue(second.should_send_notification())
+
+        self.assertTrue(first.claim_notification())
+        self.assertFalse(second.claim_notification())
+        self.assertIsNotNone(first.last_notification_sent)
+
+    def test_claim_after_interval(self):
+        Course.objects.filter(pk=self.course.pk).update(
+            last_notification_sent=timezone.now() - timedelta(hours=5)
+        )
+        self.course.refresh_from_db()
+
+        self.assertTrue(self.course.claim_notification())
+        self.assertFalse(self.course.claim_notification())
+
+    @override_settings(NOTIFICATION_INTERVAL_HOURS=1)
+    def test_interval_is_configurable(self):
+        Course.objects.filter(pk=self.course.pk).update(
+            last_notification_sent=timezone.now() - timedelta(hours=2)
+        )
+        self.course.refresh_from_db()
+
+        self.assertTrue(self.course.should_send_notification())
+        self.assertEqual(self.course.next_notification_in_hours(), 0)
+        self.assertTrue(self.course.claim_notification())
+        self.assertAlmostEqual(self.course.next_notification_in_hours(), 1, places=2)
+
+    def test_repeated_task_sends_once(self):
+        user = User.objects.create(email="subscriber@test.com")
+        CourseSubscription.objects.create(user=user, course=self.course)
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+        first = send_course_update_notification(self.course.id)
+        second = send_course_update_notification(self.course.id)
+
+        self.assertEqual(first["status"], "started")
+        self.assertEqual(second["status"], "skipped")
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class CourseSubscriptionBulkTests(CourseSubscriptionAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.bulk_url = reverse("materials:subscriptions_bulk")
+        self.authenticate_user()
+
+    def test_bulk_subscribe(self):
+        CourseSubscription.objects.create(user=self.user, course=self.course)
+
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                self.bulk_url,
+                {
+                    "action": "subscribe",
+                    "course_ids": [self.course.id, self.course2.id, 999],
+                },
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"course_id": self.course.id, "status": "already_subscribed"},
+                {"course_id": self.course2.id, "status": "subscribed"},
+                {"course_id": 999, "status": "not_found"},
+            ],
+        )
+        self.assertEqual(CourseSubscription.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_unsubscribe(self):
+        CourseSubscription.objects.create(user=self.user, course=self.course)
+        CourseSubscription.objects.create(user=self.other_user, course=self.course)
+
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                self.bulk_url,
+                {
+                    "action": "unsubscribe",
+                    "course_ids": [self.course.id, self.course2.id],
+                },
+                format="json",
+            )
+
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"course_id": self.course.id, "status": "unsubscribed"},
+                {"course_id": self.course2.id, "status": "not_subscribed"},
+            ],
+        )
+        self.assertFalse(CourseSubscription.objects.filter(user=self.user).exists())
+        self.assertTrue(
+            CourseSubscription.objects.filter(user=self.other_user).exists()
+        )
+
+    def test_bulk_duplicate_ids_reported_once(self):
+        response = self.client.post(
+            self.bulk_url,
+            {"action": "subscribe", "course_ids": [self.course.id, self.course.id]},
+            format="json",
+        )
+
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(CourseSubscription.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_invalid_payload(self):
+        response = self.client.post(
+            self.bulk_url, {"action": "follow", "course_ids": []}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("action", response.data)
+        self.assertIn("course_ids", response.data)
+
+
+class LessonBulkAPITestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(email="owner@test.com")
+        self.other = User.objects.create(email="other@test.com")
+        self.course = Course.objects.create(name="Курс", owner=self.owner)
+        self.other_course = Course.objects.create(name="Чужой", owner=self.other)
+        self.lessons = Lesson.objects.bulk_create(
+            Lesson(name=f"Урок {i}", course=self.course, owner=self.owner)
+            for i in range(3)
+        )
+        self.url = reverse("materials:lesson_bulk")
+        self.client.force_authenticate(user=self.owner)
+
+    def create_payload(self, count, course=None):
+        return [
+            {
+                "name": f"Новый урок {i}",
+                "description": "Описание",
+                "course": (course or self.course).id,
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self):
+        version = get_course_version(self.course.id)
+
+        response = self.client.post(self.url, self.create_payload(3), format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        self.assertTrue(all(lesson["id"] for lesson in response.data))
+        self.assertEqual(
+            Lesson.objects.filter(course=self.course, owner=self.owner).count(), 6
+        )
+        self.assertNotEqual(get_course_version(self.course.id), version)
+
+    def test_bulk_create_queries_do_not_grow_with_rows(self):
+        self.client.post(self.url, self.create_payload(1), format="json")
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, self.create_payload(2), format="json")
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.url, self.create_payload(20), format="json")
+
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_create_in_foreign_course_denied(self):
+        response = self.client.post(
+            self.url,
+            self.create_payload(1) + self.create_payload(1, self.other_course),
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Lesson.objects.count(), 3)
+
+    def test_bulk_create_permissions_checked_before_validation(self):
+        """Ошибки полей не раскрывают уроки чужого курса"""
+        payload = self.create_payload(1, self.other_course) + [{"course": 999}]
+
+        response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_update_foreign_lesson_denied(self):
+        self.client.force_authenticate(user=self.other)
+
+        response = self.client.patch(
+            self.url, [{"id": self.lessons[0].id, "name": ""}], format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertNotIn("name", str(response.data))
+
+    def test_bulk_create_reports_row_errors(self):
+        payload = self.create_payload(1) + [{"name": "Без курса"}, {"course": 999}]
+
+        response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Lesson.objects.count(), 3)
+
+    def test_bulk_update_notifies_once_per_course(self):
+        payload = [
+            {"id": lesson.id, "name": f"Изменен {lesson.id}"} for lesson in self.lessons
+        ]
+        old_updated_at = Course.objects.get(pk=self.course.pk).updated_at
+
+        with patch("materials.views.enqueue_course_update_notification") as enqueue:
+            response = self.client.patch(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        enqueue.assert_called_once_with(self.course.id)
+        self.assertEqual(
+            sorted(Lesson.objects.values_list("name", flat=True)),
+            sorted(item["name"] for item in payload),
+        )
+        self.assertGreater(
+            Course.objects.get(pk=self.course.pk).updated_at, old_updated_at
+        )
+
+    def test_bulk_update_moves_lesson(self):
+        Course.objects.filter(pk=self.other_course.pk).update(owner=self.owner)
+
+        with patch("materials.views.enqueue_course_update_notification") as enqueue:
+            self.client.patch(
+                self.url,
+                [{"id": self.lessons[0].id, "course": self.other_course.id}],
+                format="json",
+            )
+
+        self.assertEqual(
+            Lesson.objects.get(pk=self.lessons[0].pk).course_id, self.other_course.id
+        )
+        self.assertEqual(enqueue.call_count, 2)
+
+    def test_bulk_update_unknown_lesson(self):
+        response = self.client.patch(
+            self.url, [{"id": 999, "name": "Нет такого"}], format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_by_moderator(self):
+        moderator = User.objects.create(email="moder@test.com")
+        moderator.groups.add(Group.objects.create(name="Moders"))
+        self.client.force_authenticate(user=moderator)
+
+        response = self.client.patch(
+            self.url, [{"id": self.lessons[0].id, "name": "Модератор"}], format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_delete(self):
+        lessons = self.lessons + Lesson.objects.bulk_create(
+            Lesson(name=f"Урок {i}", course=self.course, owner=self.owner)
+            for i in range(3, 6)
+        )
+        # Первый запрос кэширует проверку роли модератора
+        self.client.delete(self.url, {"ids": [lessons[0].id]}, format="json")
+        version = get_course_version(self.course.id)
+
+        with self.assertNumQueries(6):
+            response = self.client.delete(
+                self.url, {"ids": [lessons[1].id]}, format="json"
+            )
+        self.assertEqual(response.data["deleted"], 1)
+
+        with self.assertNumQueries(6):
+            response = self.client.delete(
+                self.url, {"ids": [lesson.id for lesson in lessons[2:]]}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["deleted"], 4)
+        self.assertFalse(Lesson.objects.exists())
+        self.assertNotEqual(get_course_version(self.course.id), version)
+
+    def test_bulk_delete_foreign_course_denied(self):
+        self.client.force_authenticate(user=self.other)
+
+        response = self.client.delete(
+            self.url, {"ids": [self.lessons[0].id]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Lesson.objects.count(), 3)
+
+
+class CourseImportTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@test.com")
+        self.url = reverse("materials:course_import")
+        self.client.force_authenticate(user=self.owner)
+
+    def ndjson(self, *rows):
+        return "\n".join(
+            row if isinstance(row, str) else json.dumps(row) for row in rows
+        ).encode()
+
+    def course_row(self, number, lessons=2):
+        return {
+            "name": f"Курс {number}",
+            "description": "Описание",
+            "lessons": [
+                {
+                    "name": f"Урок {number}.{i}",
+                    "description": "Описание",
+                    "url": "https://youtube.com/watch?v=1",
+                }
+                for i in range(lessons)
+            ],
+        }
+
+    @override_settings(IMPORT_BATCH_SIZE=2)
+    def test_import_in_batches(self):
+        lines = self.ndjson(*(self.course_row(i) for i in range(5))).splitlines()
+
+        with CaptureQueriesContext(connection) as queries:
+            report = import_courses_ndjson(lines, self.owner)
+
+        self.assertEqual(report["courses"], 5)
+        self.assertEqual(report["lessons"], 10)
+        self.assertEqual(report["errors"], [])
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        # По пачке курсов и пачке уроков на каждые два курса
+        self.assertEqual(len(inserts), 6)
+        self.assertEqual(
+            Lesson.objects.filter(course__name="Курс 4", owner=self.owner).count(), 2
+        )
+
+    def test_bad_lines_reported_and_skipped(self):
+        bad_link = self.course_row(2)
+        bad_link["lessons"][0]["url"] = "https://example.com/video"
+        lines = self.ndjson(
+            self.course_row(1),
+            "{не json",
+            bad_link,
+            "",
+            {"description": "Без названия"},
+            self.course_row(3),
+        ).splitlines()
+
+        report = import_courses_ndjson(lines, self.owner)
+
+        self.assertEqual(report["courses"], 2)
+        self.assertEqual(report["error_count"], 3)
+        self.assertEqual([error["line"] for error in report["errors"]], [2, 3, 5])
+        self.assertIn("lessons", report["errors"][1]["errors"])
+        self.assertEqual(
+            list(Course.objects.values_list("name", flat=True)), ["Курс 1", "Курс 3"]
+        )
+
+    def test_upload_endpoint(self):
+        upload = SimpleUploadedFile(
+            "courses.ndjson",
+            self.ndjson(self.course_row(1), self.course_row(2, lessons=0)),
+            content_type="application/x-ndjson",
+        )
+
+        response = self.client.post(self.url, {"file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["courses"], 2)
+        self.assertEqual(response.data["lessons"], 2)
+        self.assertTrue(Course.objects.filter(owner=self.owner).exists())
+
+    def test_upload_without_file(self):
+        response = self.client.post(self.url, {}, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile(suffix=".ndjson") as file:
+            file.write(self.ndjson(self.course_row(1), "{"))
+            file.flush()
+            out, err = StringIO(), StringIO()
+
+            call_command(
+                "import_courses",
+                file.name,
+                owner=self.owner.email,
+                stdout=out,
+                stderr=err,
+            )
+
+        self.assertEqual(Course.objects.count(), 1)
+        self.assertIn("ошибок: 1", out.getvalue())
+        self.assertIn("Строка 2", err.getvalue())
+
+
+class PaymentExportTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="admin@test.com", is_staff=True)
+        self.user = User.objects.create(email="user@test.com")
+        self.course = Course.objects.create(name="Курс", owner=self.admin)
+        self.payments = [
+            Payment.objects.create(
+                user=self.user,
+                paid_course=self.course,
+                amount=Decimal("100.50"),
+                payment_method="card",
+            ),
+            Payment.objects.create(
+                user=self.user, amount=Decimal("200.00"), payment_method="cash"
+            ),
+            Payment.objects.create(
+                user=self.admin,
+                paid_course=self.course,
+                amount=Decimal("300.00"),
+                payment_method="card",
+            ),
+        ]
+        self.url = reverse("materials:payment-export")
+        self.client.force_authenticate(user=self.admin)
+
+    def read_csv(self, response):
+        content = b"".join(response.streaming_content).decode()
+        return list(csv.reader(StringIO(content)))
+
+    def test_export_csv_with_filter_and_ordering(self):
+        response = self.client.get(
+            self.url, {"payment_method": "card", "ordering": "payment_date"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn("payments.csv", response["Content-Disposition"])
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0][0], "id")
+        self.assertEqual(
+            [int(row[0]) for row in rows[1:]],
+            [self.payments[0].id, self.payments[2].id],
+        )
+        self.assertEqual(rows[1][4], "100.50")
+
+    def test_export_ndjson(self):
+        response = self.client.get(
+            self.url, {"export_format": "ndjson", "ordering": "-payment_date"}
+        )
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [row["id"] for row in rows],
+            [payment.id for payment in reversed(self.payments)],
+        )
+        self.assertEqual(rows[0]["amount"], "300.00")
+
+    def test_export_streams_with_chunked_iterator(self):
+        with override_settings(EXPORT_CHUNK_SIZE=1):
+            response = self.client.get(self.url)
+            rows = self.read_csv(response)
+
+        self.assertEqual(len(rows), 4)
+
+    def test_export_unknown_format(self):
+        response = self.client.get(self.url, {"export_format": "xlsx"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_requires_admin(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_list_shows_own_payments(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse("materials:payment-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(response.data["results"][0]["user"], self.user.id)
+
+    def test_payments_are_read_only(self):
+        self.client.force_authenticate(user=self.user)
+        detail_url = reverse(
+            "materials:payment-detail", kwargs={"pk": self.payments[0].pk}
+        )
+
+        create = self.client.post(
+            reverse("materials:payment-list"),
+            {"user": self.admin.id, "amount": "1.00", "payment_method": "cash"},
+        )
+        update = self.client.patch(detail_url, {"amount": "1.00"})
+        delete = self.client.delete(detail_url)
+
+        self.assertEqual(create.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(update.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(delete.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(Payment.objects.count(), 3)
+
+    def test_payment_user_is_read_only(self):
+        serializer = PaymentSerializer(
+            data={"user": self.admin.id, "amount": "1.00", "payment_method": "cash"}
+        )
+
+        self.assertTrue(serializer.is_valid())
+        self.assertNotIn("user", serializer.validated_data)
+
+
+class PaymentIndexTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="admin@test.com", is_staff=True)
+        self.course = Course.objects.create(name="Курс", owner=self.admin)
+        now = timezone.now()
+        self.payments = []
+        for days, amount in ((40, "100.00"), (10, "250.00"), (1, "500.00")):
+            payment = Payment.objects.create(
+                user=self.admin,
+                paid_course=self.course,
+                amount=Decimal(amount),
+                payment_method="card",
+            )
+            payment.payment_date = now - timedelta(days=days)
+            payment.save(update_fields=["payment_date"])
+            self.payments.append(payment)
+        self.client.force_authenticate(user=self.admin)
+
+    def explain(self, queryset, *disabled):
+        sql, params = queryset.query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            # На тестовой таблице из трех строк seq scan всегда дешевле
+            for plan_type in ("seqscan", *disabled):
+                cursor.execute(f"SET LOCAL enable_{plan_type} = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def test_filter_by_date_and_amount_range(self):
+        response = self.client.get(
+            reverse("materials:payment-list"),
+            {
+                "payment_date__gte": (timezone.now() - timedelta(days=30)).isoformat(),
+                "amount__lte": "300",
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [payment["id"] for payment in response.data["results"]],
+            [self.payments[1].id],
+        )
+
+    def test_month_range_uses_brin_index(self):
+        end = timezone.now()
+        plan = self.explain(
+            Payment.objects.order_by().filter(
+                payment_date__gte=end - timedelta(days=30), payment_date__lte=end
+            ),
+            # BRIN читается только bitmap-сканом, а на пустой таблице
+            # полный проход по B-tree оценивается дешевле
+            "indexscan",
+        )
+
+        self.assertIn("payment_date_brin", plan)
+
+    def test_course_filter_with_ordering_uses_composite_index(self):
+        plan = self.explain(
+            Payment.objects.filter(paid_course=self.course).order_by("-payment_date")
+        )
+
+        self.assertIn("payment_course_date_idx", plan)
+
+
+class CatalogSearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="user@test.com")
+        self.python = Course.objects.create(
+            name="Основы программирования на Python",
+            description="Основы языка и <script>alert(1)</script> в описании",
+            owner=self.user,
+        )
+        self.django = Course.objects.create(
+            name="Веб-разработка",
+            description="Сайты на Django, немного программирования на Python",
+            owner=self.user,
+        )
+        self.lesson = Lesson.objects.create(
+            name="Функции",
+            description="Функции в программировании",
+            course=self.django,
+            owner=self.user,
+        )
+        self.url = reverse("materials:search")
+        self.client.force_authenticate(user=self.user)
+
+    def test_search_vector_is_not_loaded_for_serialized_rows(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("materials:course-list"))
+            self.client.get(reverse("materials:lesson_list"))
+            self.client.get(
+                reverse("materials:course-detail", kwargs={"pk": self.django.pk})
+            )
+
+        self.assertTrue(queries)
+        self.assertFalse(any("search_vector" in query["sql"] for query in queries))
+
+    def test_ranked_results_across_courses_and_lessons(self):
+        response = self.client.get(self.url, {"q": "программирование"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(response.data["count"], 3)
+        # Совпадение в названии весит больше совпадения в описании
+        self.assertEqual(
+            (results[0]["type"], results[0]["id"]), ("course", self.python.id)
+        )
+        self.assertEqual(
+            {(row["type"], row["id"], row["course"]) for row in results[1:]},
+            {
+                ("course", self.django.id, self.django.id),
+                ("lesson", self.lesson.id, self.django.id),
+            },
+        )
+        self.assertGreater(results[0]["rank"], results[1]["rank"])
+
+    def test_highlight_marks_matches_and_escapes_html(self):
+        response = self.client.get(self.url, {"q": "python", "type": "course"})
+
+        results = response.data["results"]
+        self.assertEqual(
+            [row["id"] for row in results], [self.python.id, self.django.id]
+        )
+        self.assertIn("<mark>Python</mark>", results[0]["name_highlight"])
+        self.assertIn("&lt;script&gt;", results[0]["description_highlight"])
+        self.assertNotIn("<script>", results[0]["description_highlight"])
+
+    def test_vector_follows_updates(self):
+        self.lesson.name = "Декораторы"
+        self.lesson.save()
+        Lesson.objects.filter(pk=self.lesson.pk).update(description="Про замыкания")
+
+        response = self.client.get(self.url, {"q": "замыкание", "type": "lesson"})
+
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]], [self.lesson.id]
+        )
+        self.assertNotIn("search_vector", LessonSerializer(self.lesson).data)
+
+    def test_search_uses_gin_index(self):
+        queryset = Course.objects.filter(search_vector=catalog_search_query("python"))
+        sql, params = queryset.query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+
+        self.assertIn("course_search_gin", plan)
+
+    def test_query_is_required(self):
+        response = self.client.get(self.url, {"type": "course"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TypeaheadTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="user@test.com")
+        self.basics = Course.objects.create(
+            name="Python basics", description="Курс", owner=self.user
+        )
+        self.advanced = Course.objects.create(
+            name="Advanced Python", description="Курс", owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            name="Python functions",
+            description="Урок",
+            course=self.advanced,
+            owner=self.user,
+        )
+        self.url = reverse("materials:typeahead")
+        self.client.force_authenticate(user=self.user)
+
+    def get_suggestions(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row["type"], row["id"]) for row in response.data]
+
+    def test_prefix_matches_come_first(self):
+        suggestions = self.get_suggestions(q="pyth")
+
+        self.assertEqual(
+            suggestions[:2],
+            [("course", self.basics.id), ("lesson", self.lesson.id)],
+        )
+        self.assertEqual(
+            self.get_suggestions(q="pyth", type="lesson", limit=1),
+            [("lesson", self.lesson.id)],
+        )
+
+    def test_prefix_is_cached(self):
+        self.get_suggestions(q="Pyth")
+        Course.objects.create(name="Python web", description="Курс", owner=self.user)
+
+        with self.assertNumQueries(0):
+            suggestions = self.get_suggestions(q="pyth ")
+        self.assertEqual(len(suggestions), len(self.get_suggestions(q="pyth")))
+
+        cache.clear()
+        self.assertEqual(len(self.get_suggestions(q="pyth")), len(suggestions) + 1)
+
+    def test_statement_timeout_returns_empty_list(self):
+        def slow_query(*args):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_sleep(1)")
+
+        with (
+            override_settings(TYPEAHEAD_STATEMENT_TIMEOUT=10),
+            patch("materials.typeahead.typeahead_candidates", side_effect=slow_query),
+        ):
+            self.assertEqual(self.get_suggestions(q="pyth"), [])
+
+        # Пустой ответ по таймауту не кэшируется
+        self.assertEqual(len(self.get_suggestions(q="pyth")), 2)
+
+    def test_short_query_is_rejected(self):
+        response = self.client.get(self.url, {"q": "py"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_typos_and_substrings_with_trigram_index(self):
+        if not trigram_available(connection.alias):
+            self.skipTest("Расширение pg_trgm не установлено")
+
+        self.assertIn(("course", self.basics.id), self.get_suggestions(q="pyton"))
+        self.assertEqual(self.get_suggestions(q="functi"), [("lesson", self.lesson.id)])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(
+                "EXPLAIN SELECT id FROM materials_lesson WHERE name %> 'pyton'"
+            )
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("lesson_name_trgm", plan)
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import OperationalError, connections, router, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.lookups import PostgresOperatorLookup
+
+from materials.models import Course
+from materials.search import SEARCH_MODELS
+
+logger = logging.getLogger(__name__)
+
+# Короче трех символов триграммный индекс не помогает
+TYPEAHEAD_MIN_LENGTH = 3
+TYPEAHEAD_MAX_LIMIT = 20
+
+_trigram_available = {}
+
+
+class ILike(PostgresOperatorLookup):
+    """name ILIKE pattern: icontains строит UPPER(name) LIKE, который
+    триграммный индекс по name не использует."""
+
+    lookup_name = "ilike"
+    postgres_operator = "ILIKE"
+
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def trigram_available(using):
+    """Установлено ли в базе расширение pg_trgm, проверяется раз на процесс."""
+    if using not in _trigram_available:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[using] = cursor.fetchone() is not None
+    return _trigram_available[using]
+
+
+def normalize_prefix(text):
+    return " ".join(text.lower().split())
+
+
+def typeahead_cache_key(text, types, limit):
+    digest = hashlib.md5(f"{','.join(types)}:{limit}:{text}".encode()).hexdigest()
+    return f"materials:typeahead:{digest}"
+
+
+def typeahead_candidates(queryset, name, course_field, text, limit, trigram):
+    """Лучшие limit совпадений одной модели.
+
+    С pg_trgm находятся названия, содержащие текст или похожие на него
+    с опечатками (оператор %>), оба условия идут по индексу *_name_trgm.
+    Без расширения - только названия, начинающиеся с текста.
+    """
+    queryset = queryset.annotate(
+        type=Value(name),
+        course_ref=F(course_field),
+        prefix_match=Case(When(name__istartswith=text, then=1), default=0),
+    )
+    if trigram:
+        queryset = queryset.filter(
+            ILike(F("name"), f"%{escape_like(text)}%")
+            | TrigramWordSimilar(F("name"), text)
+        ).annotate(score=TrigramWordSimilarity(text, "name"))
+    else:
+        queryset = queryset.filter(name__istartswith=text).annotate(
+            score=Value(0.0, output_field=FloatField())
+        )
+    return list(
+        queryset.order_by("-prefix_match", "-score", "name", "id").values(
+            "type", "id", "course_ref", "name", "prefix_match", "score"
+        )[:limit]
+    )
+
+
+def typeahead(text, types=None, limit=None):
+    """Подсказки по названиям курсов и уроков.
+
+    Сначала названия, начинающиеся с текста, затем остальные по сходству.
+    Ответ для префикса кэшируется на TYPEAHEAD_CACHE_TIMEOUT секунд.
+    Запросы ограничены TYPEAHEAD_STATEMENT_TIMEOUT миллисекундами: если
+    база не уложилась, возвращается пустой список, он не кэшируется.
+    """
+    text = normalize_prefix(text)
+    limit = limit or settings.TYPEAHEAD_LIMIT
+    types = [name for name in SEARCH_MODELS if not types or name in types]
+    key = typeahead_cache_key(text, types, limit)
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    using = router.db_for_read(Course)
+    trigram = trigram_available(using)
+    candidates = []
+    try:
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL statement_timeout = "
+                    f"{int(settings.TYPEAHEAD_STATEMENT_TIMEOUT)}"
+                )
+            for name in types:
+                model, course_field = SEARCH_MODELS[name]
+                candidates += typeahead_candidates(
+                    model.objects.using(using),
+                    name,
+                    course_field,
+                    text,
+                    limit,
+                    trigram,
+                )
+    except OperationalError as e:
+        # 57014 - query_canceled, сработал statement_timeout
+        if getattr(e.__cause__, "sqlstate", None) != "57014":
+            raise
+        logger.warning(f"Подсказки для '{text}' не уложились во время: {e}")
+        return []
+
+    candidates.sort(
+        key=lambda row: (-row["prefix_match"], -row["score"], row["name"], row["id"])
+    )
+    results = [
+        {field: row[field] for field in ("type", "id", "course_ref", "name")}
+        for row in candidates[:limit]
+    ]
+    cache.set(key, results, settings.TYPEAHEAD_CACHE_TIMEOUT)
+    return results
@@ -2,20 +2,28 @@ from django.urls import path
 from rest_framework.routers import SimpleRouter
 
 from materials.apps import MaterialsConfig
-from materials.views import (CourseSubscriptionAPIView, CourseViewSet,
-                             LessonCreateAPIView, LessonDestroyAPIView,
-                             LessonListAPIView, LessonRetrieveAPIView,
-                             LessonUpdateAPIView)
+from materials.views import (CatalogSearchAPIView, CourseImportAPIView,
+                             CourseSubscriptionAPIView,
+                             CourseSubscriptionBulkAPIView, CourseViewSet,
+                             LessonBulkAPIView, LessonCreateAPIView,
+                             LessonDestroyAPIView, LessonListAPIView,
+                             LessonRetrieveAPIView, LessonUpdateAPIView,
+                             PaymentViewSet, ResponseCacheStatsAPIView,
+                             TypeaheadAPIView)
 
 app_name = MaterialsConfig.name
 
 router = SimpleRouter()
+# payments регистрируется раньше курсов, иначе "payments/"
+# совпадет с детальным маршрутом курса
+router.register("payments", PaymentViewSet)
 router.register("", CourseViewSet)
 
 urlpatterns = [
     path("lessons/", LessonListAPIView.as_view(), name="lesson_list"),
     path("lessons/<int:pk>/", LessonRetrieveAPIView.as_view(), name="lesson_retrieve"),
     path("lessons/create/", LessonCreateAPIView.as_view(), name="lesson_create"),
+    path("lessons/bulk/", LessonBulkAPIView.as_view(), name="lesson_bulk"),
     path(
         "lessons/<int:pk>/delete/",
         LessonDestroyAPIView.as_view(),
@@ -27,6 +35,15 @@ urlpatterns = [
         name="lesson_update",
     ),
     path("subscriptions/", CourseSubscriptionAPIView.as_view(), name="subscriptions"),
+    path(
+        "subscriptions/bulk/",
+        CourseSubscriptionBulkAPIView.as_view(),
+        name="subscriptions_bulk",
+    ),
+    path("cache/stats/", ResponseCacheStatsAPIView.as_view(), name="cache_stats"),
+    path("import/", CourseImportAPIView.as_view(), name="course_import"),
+    path("search/", CatalogSearchAPIView.as_view(), name="search"),
+    path("typeahead/", TypeaheadAPIView.as_view(), name="typeahead"),
 ]
 
 urlpatterns += router.urls
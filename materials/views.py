@@ -1,29 +1,71 @@
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Prefetch
+from django.http import Http404
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
-                                     ListAPIView, RetrieveAPIView,
-                                     UpdateAPIView, get_object_or_404)
-from rest_framework.permissions import IsAuthenticated
+                                     GenericAPIView, ListAPIView,
+                                     RetrieveAPIView, UpdateAPIView,
+                                     get_object_or_404)
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.viewsets import ModelViewSet
-
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+
+from materials.cache import (bump_course_version, get_cached_course_response,
+                             get_response_cache_stats)
+from materials.conditional import (ConditionalListMixin, make_etag,
+                                   not_modified_response, set_validators)
+from materials.exports import EXPORT_FORMATS, streaming_export_response
+from materials.importers import import_courses_ndjson
 from materials.models import Course, CourseSubscription, Lesson
-from materials.paginations import CustomPagination
-from materials.serializers import (CourseSerializer,
+from materials.paginations import (CustomPagination, EstimatedCountPagination,
+                                   IteratorPagination, PaginationModeMixin,
+                                   SubscriptionPagination)
+from materials.search import add_highlights, search_catalog
+from materials.serializers import (CatalogSearchQuerySerializer,
+                                   CatalogSearchResultSerializer,
+                                   CourseSerializer,
+                                   CourseSubscriptionBulkSerializer,
                                    CourseSubscriptionSerializer,
-                                   LessonSerializer)
-from materials.tasks import send_course_update_notification
+                                   LessonBulkDeleteSerializer,
+                                   LessonBulkSerializer, LessonSerializer,
+                                   TypeaheadQuerySerializer,
+                                   TypeaheadResultSerializer)
+from materials.tasks import (enqueue_course_update_notification,
+                             get_notification_progress,
+                             get_pending_notification,
+                             send_course_update_notification)
+from materials.typeahead import typeahead
+from users.archive import find_archived_payments
 from users.models import Payment
 from users.permissions import IsModer, IsOwner
+from users.serializers import (ArchivedPaymentQuerySerializer,
+                               PaymentSerializer)
 
 
-class CourseViewSet(ModelViewSet):
+class CourseViewSet(ConditionalListMixin, PaginationModeMixin, ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
-    pagination_class = CustomPagination
+    pagination_class = EstimatedCountPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by("id")
+        if self.action in ("list", "retrieve"):
+            # Уроки и их количество грузятся одним запросом на страницу,
+            # а не по запросу на каждый курс
+            queryset = queryset.annotate(
+                lessons_count=Count("lesson", distinct=True)
+            ).prefetch_related(
+                Prefetch("lesson_set", queryset=Lesson.objects.all())
+            )
+        return queryset
 
     def get_permissions(self):
         if self.action == "create":
@@ -34,6 +76,28 @@ class CourseViewSet(ModelViewSet):
             self.permission_classes = (~IsModer | IsOwner,)
         return super().get_permissions()
 
+    def retrieve(self, request, *args, **kwargs):
+        # Права проверяются по "легкому" объекту, а курс с уроками
+        # собирается из базы только при промахе кэша
+        course = get_object_or_404(
+            Course.objects.only("id", "owner_id", "updated_at"), pk=kwargs["pk"]
+        )
+        self.check_object_permissions(request, course)
+
+        # updated_at курса меняется и при изменении его уроков
+        etag = make_etag("course", course.pk, course.updated_at.isoformat())
+        not_modified = not_modified_response(request, etag, course.updated_at)
+        if not_modified is not None:
+            return not_modified
+
+        data = get_cached_course_response(
+            course.pk,
+            request,
+            "course",
+            lambda: self.get_serializer(self.get_queryset().get(pk=course.pk)).data,
+        )
+        return set_validators(Response(data), etag, course.updated_at)
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
@@ -41,7 +105,7 @@ class CourseViewSet(ModelViewSet):
         instance = serializer.save()
 
         if instance.should_send_notification():
-            send_course_update_notification.delay(instance.id)
+            enqueue_course_update_notification(instance.id)
 
         return instance
 
@@ -53,10 +117,8 @@ class CourseViewSet(ModelViewSet):
         if course.last_notification_sent:
             time_since_last = timezone.now() - course.last_notification_sent
             hours_since_last = time_since_last.total_seconds() / 3600
-            next_notification_in = max(0, 4 - hours_since_last)
         else:
             hours_since_last = None
-            next_notification_in = 0
 
         return Response({
             "course_id": course.id,
@@ -64,7 +126,9 @@ class CourseViewSet(ModelViewSet):
             "can_send_notification": can_send,
             "last_notification_sent": course.last_notification_sent,
             "hours_since_last_notification": hours_since_last,
-            "next_notification_in_hours": next_notification_in
+            "next_notification_in_hours": course.next_notification_in_hours(),
+            "pending_task_id": get_pending_notification(course.id),
+            "progress": get_notification_progress(course.id),
         })
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
@@ -73,10 +137,10 @@ class CourseViewSet(ModelViewSet):
 
         if not course.should_send_notification():
             return Response({
-                "error": "Нельзя отправить уведомление - прошло менее 4 часов с предыдущего",
+                "error": f"Нельзя отправить уведомление - прошло менее "
+                         f"{settings.NOTIFICATION_INTERVAL_HOURS} ч. с предыдущего",
                 "last_notification_sent": course.last_notification_sent,
-                "next_notification_available_in_hours": max(0, 4 - (
-                            timezone.now() - course.last_notification_sent).total_seconds() / 3600)
+                "next_notification_available_in_hours": course.next_notification_in_hours(),
             }, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         task_result = send_course_update_notification.delay(course.id)
@@ -98,10 +162,10 @@ class LessonCreateAPIView(CreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class LessonListAPIView(ListAPIView):
+class LessonListAPIView(ConditionalListMixin, PaginationModeMixin, ListAPIView):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
-    pagination_class = CustomPagination
+    pagination_class = EstimatedCountPagination
 
 
 class LessonRetrieveAPIView(RetrieveAPIView):
@@ -109,6 +173,26 @@ class LessonRetrieveAPIView(RetrieveAPIView):
     serializer_class = LessonSerializer
     permission_classes = (IsAuthenticated, IsOwner | IsModer)
 
+    def retrieve(self, request, *args, **kwargs):
+        lesson = get_object_or_404(
+            Lesson.objects.only("id", "owner_id", "course_id", "updated_at"),
+            pk=kwargs["pk"],
+        )
+        self.check_object_permissions(request, lesson)
+
+        etag = make_etag("lesson", lesson.pk, lesson.updated_at.isoformat())
+        not_modified = not_modified_response(request, etag, lesson.updated_at)
+        if not_modified is not None:
+            return not_modified
+
+        data = get_cached_course_response(
+            lesson.course_id,
+            request,
+            f"lesson:{lesson.pk}",
+            lambda: self.get_serializer(self.get_queryset().get(pk=lesson.pk)).data,
+        )
+        return set_validators(Response(data), etag, lesson.updated_at)
+
 
 class LessonDestroyAPIView(DestroyAPIView):
     queryset = Lesson.objects.all()
@@ -126,21 +210,326 @@ class LessonUpdateAPIView(UpdateAPIView):
 
         if instance.course:
             if instance.course.should_send_notification():
-                send_course_update_notification.delay(instance.course.id)
+                enqueue_course_update_notification(instance.course.id)
 
         return instance
 
 
-class PaymentViewSet(ModelViewSet):
+class LessonBulkAPIView(GenericAPIView):
+    """Массовое создание (POST), обновление (PATCH) и удаление (DELETE) уроков.
+
+    Права проверяются один раз на курс и до проверки данных, чтобы ошибки
+    полей не раскрывали чужие курсы и уроки: создавать уроки может владелец
+    курса, не являющийся модератором, изменять - владелец или модератор,
+    удалять - владелец. Все изменения выполняются в одной транзакции.
+    """
+
+    serializer_class = LessonBulkSerializer
+    permission_classes = (IsAuthenticated,)
+    max_batch_size = 500
+
+    def load_courses(self, course_ids):
+        courses = Course.objects.only("id", "owner_id", "last_notification_sent")
+        return courses.in_bulk(course_ids)
+
+    def requested_course_ids(self, data):
+        if not isinstance(data, list):
+            return set()
+        return {
+            int(item["course"])
+            for item in data
+            if isinstance(item, dict) and str(item.get("course", "")).isdigit()
+        }
+
+    def check_course_permissions(self, request, courses):
+        is_moder = IsModer().has_permission(request, self)
+        for course in courses:
+            is_owner = course.owner_id == request.user.pk
+            if request.method == "POST":
+                allowed = is_owner and not is_moder
+            elif request.method == "DELETE":
+                allowed = is_owner
+            else:
+                allowed = is_owner or is_moder
+            if not allowed:
+                self.permission_denied(
+                    request, message=f"Нет прав на уроки курса {course.pk}"
+                )
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        return self.get_serializer(
+            *args, many=True, max_length=self.max_batch_size, **kwargs
+        )
+
+    def touch_courses(self, course_ids):
+        """Сигналы при bulk-операциях не срабатывают, поэтому кэш и updated_at
+        курсов обновляются здесь, по одному разу на курс."""
+        Course.objects.filter(pk__in=course_ids).update(updated_at=timezone.now())
+        for course_id in course_ids:
+            bump_course_version(course_id)
+
+    def post(self, request, *args, **kwargs):
+        courses = self.load_courses(self.requested_course_ids(request.data))
+        self.check_course_permissions(request, courses.values())
+        serializer = self.get_bulk_serializer(
+            data=request.data,
+            context={**self.get_serializer_context(), "courses": courses},
+        )
+        serializer.is_valid(raise_exception=True)
+
+        lessons = []
+        for item in serializer.validated_data:
+            item.pop("id", None)
+            lessons.append(Lesson(owner=request.user, **item))
+
+        using = router.db_for_write(Lesson)
+        with transaction.atomic(using=using):
+            Lesson.objects.using(using).bulk_create(lessons)
+            self.touch_courses({lesson.course_id for lesson in lessons})
+
+        return Response(
+            LessonSerializer(lessons, many=True).data, status=status.HTTP_201_CREATED
+        )
+
+    def patch(self, request, *args, **kwargs):
+        lesson_ids = [
+            item.get("id")
+            for item in (request.data if isinstance(request.data, list) else [])
+            if isinstance(item, dict) and isinstance(item.get("id"), int)
+        ]
+        instances = Lesson.objects.in_bulk(lesson_ids)
+        courses = self.load_courses(
+            self.requested_course_ids(request.data)
+            | {lesson.course_id for lesson in instances.values()}
+        )
+        self.check_course_permissions(request, courses.values())
+        serializer = self.get_bulk_serializer(
+            instances,
+            data=request.data,
+            partial=True,
+            context={**self.get_serializer_context(), "courses": courses},
+        )
+        serializer.is_valid(raise_exception=True)
+
+        now = timezone.now()
+        updated = {}
+        fields = {"updated_at"}
+        affected_courses = set()
+        for item in serializer.validated_data:
+            lesson = instances[item.pop("id")]
+            previous_course_id = lesson.course_id
+            for field, value in item.items():
+                setattr(lesson, field, value)
+                fields.add(field)
+            # auto_now при bulk_update не срабатывает
+            lesson.updated_at = now
+            # При переносе урока затронуты и прежний, и новый курс
+            affected_courses.update(
+                {courses[previous_course_id], courses[lesson.course_id]}
+            )
+            updated[lesson.pk] = lesson
+
+        using = router.db_for_write(Lesson)
+        with transaction.atomic(using=using):
+            Lesson.objects.using(using).bulk_update(updated.values(), sorted(fields))
+            self.touch_courses({course.pk for course in affected_courses})
+
+        for course in affected_courses:
+            if course.should_send_notification():
+                enqueue_course_update_notification(course.pk)
+
+        return Response(LessonSerializer(updated.values(), many=True).data)
+
+    def delete(self, request, *args, **kwargs):
+        serializer = LessonBulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lesson_ids = serializer.validated_data["ids"]
+
+        lesson_courses = dict(
+            Lesson.objects.filter(pk__in=lesson_ids).values_list("pk", "course_id")
+        )
+        missing = [pk for pk in lesson_ids if pk not in lesson_courses]
+        if missing:
+            raise ValidationError({"ids": f"Уроки не найдены: {missing}"})
+        self.check_course_permissions(
+            request, self.load_courses(set(lesson_courses.values())).values()
+        )
+
+        # На уроки не ссылаются другие таблицы, поэтому удаляем одним
+        # DELETE без сбора связанных объектов и сигналов на каждую строку
+        using = router.db_for_write(Lesson)
+        with transaction.atomic(using=using):
+            deleted = Lesson.objects.filter(pk__in=lesson_courses)._raw_delete(using)
+            self.touch_courses(set(lesson_courses.values()))
+
+        return Response({"deleted": deleted})
+
+
+class CourseImportAPIView(APIView):
+    """Импорт курсов с уроками из NDJSON-файла, переданного в поле file.
+
+    Файл читается построчно, большие загрузки Django держит во временном
+    файле, поэтому память не зависит от размера импорта.
+    """
+
+    parser_classes = (MultiPartParser,)
+    permission_classes = (IsAuthenticated, ~IsModer)
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"error": "Файл file обязателен"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        report = import_courses_ndjson(upload, request.user)
+        return Response(report)
+
+
+class ResponseCacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_response_cache_stats())
+
+
+class PaymentViewSet(ReadOnlyModelViewSet):
+    """Платежи только для чтения: они создаются оплатой, а не через API."""
+
     queryset = Payment.objects.all()
+    serializer_class = PaymentSerializer
+    pagination_class = EstimatedCountPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ("payment_date", "paid_course", "payment_method")
+    filterset_fields = {
+        "payment_date": ["exact", "gte", "lte"],
+        "paid_course": ["exact"],
+        "payment_method": ["exact"],
+        "amount": ["gte", "lte"],
+    }
     ordering_fields = ("payment_date",)
+    export_fields = (
+        "id",
+        "user_id",
+        "payment_date",
+        "paid_course_id",
+        "amount",
+        "payment_method",
+    )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """Выгрузка платежей потоком в CSV или NDJSON (?export_format=ndjson).
+
+        Учитывает те же фильтры и сортировку, что и список.
+        """
+        export_format = request.query_params.get("export_format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Формат выгрузки: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
+        return streaming_export_response(
+            self.filter_queryset(self.get_queryset()),
+            self.export_fields,
+            export_format,
+            "payments",
+            settings.EXPORT_CHUNK_SIZE,
+        )
+
+    @action(detail=False, methods=["get"], pagination_class=IteratorPagination)
+    def archived(self, request):
+        """Платежи, перенесенные в архив: по id (?id=1&id=2) и/или диапазону
+        дат (?payment_date__gte=...&payment_date__lte=...).
+
+        Архив читается только по явному запросу, список и фильтры
+        PaymentViewSet его не затрагивают. Архивы распаковываются
+        потоком и только до конца запрошенной страницы.
+        """
+        query = ArchivedPaymentQuerySerializer(
+            data=request.query_params, context=self.get_serializer_context()
+        )
+        query.is_valid(raise_exception=True)
+        rows = find_archived_payments(
+            ids=query.validated_data.get("id"),
+            start=query.validated_data.get("payment_date__gte"),
+            end=query.validated_data.get("payment_date__lte"),
+            user_id=None if request.user.is_staff else request.user.id,
+        )
+        try:
+            page = self.paginate_queryset(rows)
+        finally:
+            # Закрывает открытый архив, если страница кончилась посреди файла
+            rows.close()
+        return self.get_paginated_response(page)
+
+
+class CatalogSearchAPIView(ListAPIView):
+    """Полнотекстовый поиск по курсам и урокам.
+
+    ?q= - запрос в синтаксисе websearch, ?type=course|lesson сужает поиск.
+    Результаты отсортированы по релевантности и содержат подсветку.
+    """
+
+    serializer_class = CatalogSearchResultSerializer
+    pagination_class = CustomPagination
+
+    @cached_property
+    def search_params(self):
+        query = CatalogSearchQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        return query.validated_data
+
+    def get_queryset(self):
+        params = self.search_params
+        types = [params["type"]] if "type" in params else None
+        return search_catalog(params["q"], types)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        add_highlights(page, self.search_params["q"])
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class TypeaheadAPIView(APIView):
+    """Подсказки по названиям курсов и уроков для поля поиска.
+
+    ?q= - начало или часть названия (от трех символов), ?type=course|lesson,
+    ?limit= - число подсказок.
+    """
+
+    def get(self, request):
+        query = TypeaheadQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        results = typeahead(
+            params["q"],
+            [params["type"]] if "type" in params else None,
+            params.get("limit"),
+        )
+        return Response(TypeaheadResultSerializer(results, many=True).data)
 
-class CourseSubscriptionAPIView(APIView):
+
+class CourseSubscriptionAPIView(GenericAPIView):
+    serializer_class = CourseSubscriptionSerializer
+    pagination_class = SubscriptionPagination
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return (
+            CourseSubscription.objects.filter(user=self.request.user)
+            .select_related("course", "user")
+            .only("id", "user__id", "user__email", "course__id", "course__name")
+            .order_by("id")
+        )
+
     def post(self, request, *args, **kwargs):
         user = request.user
         course_id = request.data.get("course_id")
@@ -150,37 +539,61 @@ class CourseSubscriptionAPIView(APIView):
                 {"error": "course_id обязателен"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        course = get_object_or_404(Course, id=course_id)
+        try:
+            course_id = int(course_id)
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "course_id должен быть числом"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        subscription_exists = CourseSubscription.objects.filter(
-            user=user, course=course
-        ).exists()
+        subscribed, course_name = CourseSubscription.toggle(user.pk, course_id)
+        if course_name is None:
+            raise Http404
 
-        if subscription_exists:
-            CourseSubscription.objects.filter(user=user, course=course).delete()
-            message = "Подписка удалена"
-            subscription_status = False
-        else:
-            subscription = CourseSubscription.objects.create(user=user, course=course)
+        if subscribed:
             message = "Подписка добавлена"
-            subscription_status = True
-
-            serializer = CourseSubscriptionSerializer(subscription)
+        else:
+            message = "Подписка удалена"
 
         return Response(
             {
                 "message": message,
-                "subscription_status": subscription_status,
+                "subscription_status": subscribed,
                 "course_id": course_id,
-                "course_name": course.name,
+                "course_name": course_name,
             }
         )
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        subscriptions = CourseSubscription.objects.filter(user=user)
-        serializer = CourseSubscriptionSerializer(subscriptions, many=True)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class CourseSubscriptionBulkAPIView(GenericAPIView):
+    """Подписка и отписка сразу от списка курсов."""
+
+    serializer_class = CourseSubscriptionBulkSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action = serializer.validated_data["action"]
+
+        results = CourseSubscription.bulk_set(
+            request.user.pk,
+            serializer.validated_data["course_ids"],
+            subscribe=action == CourseSubscriptionBulkSerializer.SUBSCRIBE,
+        )
 
         return Response(
-            {"count": subscriptions.count(), "subscriptions": serializer.data}
+            {
+                "action": action,
+                "results": [
+                    {"course_id": course_id, "status": result}
+                    for course_id, result in results.items()
+                ],
+            }
         )
@@ -0,0 +1,173 @@
+import gzip
+import json
+import os
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from users.models import Payment, PaymentArchive
+from users.partitions import add_months, month_bound, month_start
+
+# Ключи строки архива совпадают с полями PaymentSerializer
+ARCHIVE_FIELDS = {
+    "id": "id",
+    "user": "user_id",
+    "payment_date": "payment_date",
+    "paid_course": "paid_course_id",
+    "amount": "amount",
+    "payment_method": "payment_method",
+}
+
+
+class PaymentArchiveError(Exception):
+    pass
+
+
+def archive_cutoff():
+    """Первый месяц, платежи которого остаются в таблице."""
+    return add_months(
+        month_start(timezone.localdate()), -settings.PAYMENT_ARCHIVE_AFTER_MONTHS
+    )
+
+
+def archive_file_path(archive):
+    return settings.PAYMENT_ARCHIVE_ROOT / archive.path
+
+
+def encode_archive_row(row):
+    row = dict(zip(ARCHIVE_FIELDS, row))
+    row["payment_date"] = row["payment_date"].isoformat()
+    row["amount"] = str(row["amount"])
+    return json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def archive_payment_month(month, using=None):
+    """Переносит платежи месяца в gzip NDJSON файл и удаляет их из таблицы.
+
+    Файл дописывается до конца и переименовывается до удаления платежей,
+    удаление и запись в PaymentArchive идут в одной транзакции. Сводка
+    выручки за месяц не меняется. Возвращает PaymentArchive или None,
+    если платежей за месяц нет.
+    """
+    using = using or router.db_for_write(Payment)
+    month = month_start(month)
+    payments = Payment.objects.using(using).filter(
+        payment_date__gte=month_bound(month),
+        payment_date__lt=month_bound(add_months(month, 1)),
+    )
+    rows = (
+        payments.order_by("id")
+        .values_list(*ARCHIVE_FIELDS.values())
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+    # Имя уникально для каждого запуска: поздние платежи того же месяца
+    # попадут в новый файл, а не перезапишут старый
+    stamp = timezone.now().strftime("%Y%m%d%H%M%S%f")
+    relative = f"{month:%Y}/payments-{month:%Y-%m}-{stamp}.ndjson.gz"
+    path = settings.PAYMENT_ARCHIVE_ROOT / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.tmp")
+
+    archive = PaymentArchive(month=month, path=relative, count=0)
+    try:
+        with gzip.open(temporary, "wt", encoding="utf-8") as file:
+            for row in rows:
+                payment_id, payment_date = row[0], row[2]
+                if not archive.count:
+                    archive.first_id = payment_id
+                    archive.first_date = archive.last_date = payment_date
+                archive.last_id = payment_id
+                archive.first_date = min(archive.first_date, payment_date)
+                archive.last_date = max(archive.last_date, payment_date)
+                archive.count += 1
+                file.write(encode_archive_row(row))
+            file.flush()
+            os.fsync(file.fileno())
+        if not archive.count:
+            temporary.unlink()
+            return None
+        os.replace(temporary, path)
+
+        with transaction.atomic(using=using):
+            archive.save(using=using)
+            # _raw_delete не вызывает сигналы: выручка архивных платежей
+            # остается в сводке
+            deleted = payments.filter(id__lte=archive.last_id)._raw_delete(using)
+            if deleted != archive.count:
+                raise PaymentArchiveError(
+                    f"Платежи за {month:%Y-%m} изменились во время архивации: "
+                    f"записано {archive.count}, удалено {deleted}"
+                )
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        path.unlink(missing_ok=True)
+        raise
+    return archive
+
+
+def archive_old_payments(before=None, using=None):
+    """Архивирует платежи всех месяцев раньше before (по умолчанию
+    archive_cutoff()), возвращает созданные PaymentArchive."""
+    using = using or router.db_for_write(Payment)
+    before = month_start(before or archive_cutoff())
+    months = (
+        Payment.objects.using(using)
+        .filter(payment_date__lt=month_bound(before))
+        .dates("payment_date", "month")
+    )
+    archives = []
+    for month in months:
+        archive = archive_payment_month(month, using)
+        if archive is not None:
+            archives.append(archive)
+    return archives
+
+
+def iter_archive(archive):
+    with gzip.open(archive_file_path(archive), "rt", encoding="utf-8") as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def find_archived_payments(ids=None, start=None, end=None, user_id=None):
+    """Архивные платежи по списку id и/или диапазону дат оплаты.
+
+    По таблице PaymentArchive выбираются только файлы, чьи диапазоны id
+    и дат пересекаются с запросом, остальные архивы не читаются.
+    """
+    archives = PaymentArchive.objects.all()
+    if ids:
+        archives = archives.filter(
+            reduce(
+                or_,
+                (
+                    Q(first_id__lte=payment_id, last_id__gte=payment_id)
+                    for payment_id in ids
+                ),
+            )
+        )
+    if start is not None:
+        archives = archives.filter(last_date__gte=start)
+    if end is not None:
+        archives = archives.filter(first_date__lte=end)
+
+    ids = set(ids or ())
+    for archive in archives:
+        for row in iter_archive(archive):
+            if ids and row["id"] not in ids:
+                continue
+            if user_id is not None and row["user"] != user_id:
+                continue
+            if start is not None or end is not None:
+                payment_date = parse_datetime(row["payment_date"])
+                if start is not None and payment_date < start:
+                    continue
+                if end is not None and payment_date > end:
+                    continue
+            yield row
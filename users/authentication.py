@@ -0,0 +1,39 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import ClaimsUser
+
+CLAIM_FIELDS = ("email", "is_active")
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT-аутентификация без SELECT из users_user на каждый запрос.
+
+    Пользователь собирается из claims токена (id, email, is_active, роль
+    модератора), которые добавляются при выдаче и обновлении токена.
+    Остальные поля догружаются, только если вьюха к ним обратится.
+    """
+
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in CLAIM_FIELDS):
+            # Токены, выданные до появления claims, проверяются по базе
+            return super().get_user(validated_token)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not validated_token["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        user = ClaimsUser.from_db(
+            None,
+            [api_settings.USER_ID_FIELD, *CLAIM_FIELDS],
+            [
+                validated_token.get(api_settings.USER_ID_CLAIM),
+                *(validated_token[claim] for claim in CLAIM_FIELDS),
+            ],
+        )
+        if user.pk is None:
+            return super().get_user(validated_token)
+
+        user._is_moder = validated_token.get("is_moder")
+        return user
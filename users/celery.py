@@ -18,4 +18,12 @@ app.conf.beat_schedule = {
         'task': 'users.tasks.check_inactive_users',
         'schedule': 86400.0,
     },
+    'maintain-payment-partitions': {
+        'task': 'users.tasks.maintain_payment_partitions',
+        'schedule': 86400.0,
+    },
+    'archive-old-payments': {
+        'task': 'users.tasks.archive_old_payments_task',
+        'schedule': 86400.0,
+    },
 }
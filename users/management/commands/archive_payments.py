@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management import BaseCommand
+
+from users.archive import archive_old_payments
+
+
+class Command(BaseCommand):
+    help = "Переносит старые платежи в gzip-архивы"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            type=date.fromisoformat,
+            help="Архивировать месяцы раньше этой даты (по умолчанию "
+            "PAYMENT_ARCHIVE_AFTER_MONTHS месяцев назад)",
+        )
+
+    def handle(self, *args, **options):
+        archives = archive_old_payments(options["before"])
+        for archive in archives:
+            self.stdout.write(f"{archive.path}: {archive.count} платежей")
+        self.stdout.write(self.style.SUCCESS(f"Создано архивов: {len(archives)}"))
@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.core.management import BaseCommand, CommandError
+
+from users.partitions import (create_payment_partitions,
+                              detach_payment_partitions)
+
+
+class Command(BaseCommand):
+    help = "Создает секции таблицы платежей наперед и отключает старые"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            help="На сколько месяцев вперед создать секции (по умолчанию из настроек)",
+        )
+        parser.add_argument(
+            "--detach-before",
+            type=date.fromisoformat,
+            help="Отключить секции месяцев раньше этой даты (YYYY-MM-DD)",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Удалить отключенные секции вместе с платежами",
+        )
+
+    def handle(self, *args, **options):
+        if options["drop"] and not options["detach_before"]:
+            raise CommandError("--drop используется вместе с --detach-before")
+
+        for partition in create_payment_partitions(options["ahead"]):
+            self.stdout.write(f"Создана секция {partition}")
+
+        if options["detach_before"]:
+            for partition in detach_payment_partitions(
+                options["detach_before"], drop=options["drop"]
+            ):
+                action = "Удалена" if options["drop"] else "Отключена"
+                self.stdout.write(f"{action} секция {partition}")
+
+        self.stdout.write(self.style.SUCCESS("Секции платежей в порядке"))
@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management import BaseCommand
+
+from users.revenue import rebuild_payment_revenue
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводку выручки по платежам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Пересчитать только дни начиная с этой даты (YYYY-MM-DD)",
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_payment_revenue(options["since"])
+        self.stdout.write(self.style.SUCCESS(f"Строк сводки записано: {rows}"))
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management import BaseCommand, CommandError
+
+from users.revenue import verify_payment_revenue
+
+
+class Command(BaseCommand):
+    help = "Сверяет сводку выручки с таблицей платежей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Сверить только дни начиная с этой даты (YYYY-MM-DD)",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = verify_payment_revenue(options["since"])
+        for mismatch in mismatches:
+            self.stderr.write(
+                f"{mismatch['day']} курс={mismatch['paid_course']} "
+                f"способ={mismatch['payment_method']}: "
+                f"ожидалось {mismatch['expected']}, в сводке {mismatch['actual']}"
+            )
+        if mismatches:
+            raise CommandError(
+                f"Расхождений: {len(mismatches)}, "
+                f"исправить: manage.py rebuild_payment_revenue"
+            )
+        self.stdout.write(self.style.SUCCESS("Сводка совпадает с платежами"))
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_payment_revenue(apps, schema_editor):
+    Payment = apps.get_model("users", "Payment")
+    PaymentRevenue = apps.get_model("users", "PaymentRevenue")
+    rows = (
+        Payment.objects.order_by()
+        .values("paid_course", "payment_method", day=TruncDate("payment_date"))
+        .annotate(total=Sum("amount"), count=Count("id"))
+    )
+    PaymentRevenue.objects.bulk_create(
+        (
+            PaymentRevenue(
+                day=row["day"],
+                paid_course_id=row["paid_course"],
+                payment_method=row["payment_method"],
+                total=row["total"],
+                count=row["count"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0007_coursesubscription_unique_course_subscription"),
+        ("users", "0007_claimsuser"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentRevenue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[("cash", "Наличными"), ("card", "Перевод на счет")],
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="Сумма"
+                    ),
+                ),
+                (
+                    "count",
+                    models.IntegerField(default=0, verbose_name="Число платежей"),
+                ),
+                (
+                    "paid_course",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="materials.course",
+                        verbose_name="Оплаченный курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Выручка за день",
+                "verbose_name_plural": "Выручка по дням",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "paid_course", "payment_method"),
+                        name="unique_payment_revenue",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_payment_revenue, migrations.RunPython.noop),
+    ]
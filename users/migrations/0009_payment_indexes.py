@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся без блокировки записи в таблицу платежей
+    atomic = False
+
+    dependencies = [
+        ("users", "0008_paymentrevenue"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["paid_course", "-payment_date"], name="payment_course_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["payment_method", "-payment_date"],
+                name="payment_method_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["user", "-payment_date"], name="payment_user_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                fields=["payment_date"], name="payment_date_brin"
+            ),
+        ),
+    ]
@@ -0,0 +1,174 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:30
+
+from datetime import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+COLUMNS = "id, payment_date, amount, payment_method, paid_course_id, user_id"
+# Секции создаются на столько месяцев вперед, дальше их создает
+# команда manage_payment_partitions
+MONTHS_AHEAD = 3
+
+
+def month_bound(year, month):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+def payment_table_objects(cursor):
+    """Определения индексов и внешних ключей таблицы платежей."""
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'users_payment'
+            AND indexname <> 'users_payment_pkey'
+        """
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = 'users_payment'::regclass AND contype = 'f'
+        """
+    )
+    return indexes, cursor.fetchall()
+
+
+def replace_payment_table(cursor, create_table):
+    """Пересоздает таблицу платежей через create_table, сохраняя данные,
+    индексы, внешние ключи и счетчик id."""
+    indexes, foreign_keys = payment_table_objects(cursor)
+    cursor.execute("SELECT pg_get_serial_sequence('users_payment', 'id')")
+    (sequence,) = cursor.fetchone()
+    cursor.execute("ALTER TABLE users_payment RENAME TO users_payment_old")
+    cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO users_payment_old_id_seq")
+    cursor.execute("ALTER INDEX users_payment_pkey RENAME TO users_payment_old_pkey")
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX "{name}"')
+
+    create_table(cursor)
+    cursor.execute(
+        f"INSERT INTO users_payment ({COLUMNS}) SELECT {COLUMNS} FROM users_payment_old"
+    )
+    cursor.execute("DROP TABLE users_payment_old")
+
+    for name, definition in foreign_keys:
+        cursor.execute(
+            f'ALTER TABLE users_payment ADD CONSTRAINT "{name}" {definition}'
+        )
+    for _, definition in indexes:
+        cursor.execute(definition.replace(" ON ONLY ", " ON "))
+    cursor.execute(
+        """
+        SELECT setval(
+            pg_get_serial_sequence('users_payment', 'id'),
+            COALESCE(MAX(id), 0) + 1,
+            false
+        ) FROM users_payment
+        """
+    )
+
+
+def name_partition_indexes(cursor, partition):
+    suffix = partition.removeprefix("users_payment_")
+    cursor.execute(
+        """
+        SELECT child.relname, parent.relname
+        FROM pg_index
+        JOIN pg_class child ON child.oid = pg_index.indexrelid
+        JOIN pg_inherits ON pg_inherits.inhrelid = pg_index.indexrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE pg_index.indrelid = %s::regclass
+        """,
+        [partition],
+    )
+    for index, parent_index in cursor.fetchall():
+        cursor.execute(f'ALTER INDEX "{index}" RENAME TO "{parent_index}_{suffix}"')
+
+
+def create_partitioned_table(cursor):
+    # Ключ секционирования обязан входить в первичный ключ, id по-прежнему
+    # уникален благодаря последовательности
+    cursor.execute(
+        """
+        CREATE TABLE users_payment (
+            id bigint NOT NULL,
+            payment_date timestamp with time zone NOT NULL,
+            amount numeric(10, 2) NOT NULL,
+            payment_method varchar(20) NOT NULL,
+            paid_course_id bigint NULL,
+            user_id bigint NOT NULL,
+            CONSTRAINT users_payment_pkey PRIMARY KEY (id, payment_date)
+        ) PARTITION BY RANGE (payment_date)
+        """
+    )
+    cursor.execute("CREATE SEQUENCE users_payment_id_seq OWNED BY users_payment.id")
+    cursor.execute(
+        "ALTER TABLE users_payment "
+        "ALTER COLUMN id SET DEFAULT nextval('users_payment_id_seq')"
+    )
+    # Сюда попадают платежи вне созданных секций
+    cursor.execute(
+        "CREATE TABLE users_payment_default PARTITION OF users_payment DEFAULT"
+    )
+
+    cursor.execute("SELECT MIN(payment_date) FROM users_payment_old")
+    first = timezone.localtime(cursor.fetchone()[0] or timezone.now())
+    now = timezone.localtime()
+    months = (now.year - first.year) * 12 + now.month - first.month + MONTHS_AHEAD
+    for offset in range(months + 1):
+        lower = month_bound(first.year, first.month + offset)
+        upper = month_bound(first.year, first.month + offset + 1)
+        cursor.execute(
+            f"CREATE TABLE users_payment_p{lower:%Y_%m} PARTITION OF users_payment "
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+
+
+def create_plain_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE users_payment (
+            id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+            payment_date timestamp with time zone NOT NULL,
+            amount numeric(10, 2) NOT NULL,
+            payment_method varchar(20) NOT NULL,
+            paid_course_id bigint NULL,
+            user_id bigint NOT NULL
+        )
+        """
+    )
+
+
+def partition_payment(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        replace_payment_table(cursor, create_partitioned_table)
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'users_payment'::regclass
+            """
+        )
+        for (partition,) in cursor.fetchall():
+            name_partition_indexes(cursor, partition)
+
+
+def unpartition_payment(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        # Секции, отключенные от таблицы, остаются отдельными таблицами
+        replace_payment_table(cursor, create_plain_table)
+
+
+# Таблица пересоздается с копированием данных, на время миграции
+# запись платежей блокируется
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0009_payment_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_payment, unpartition_payment),
+    ]
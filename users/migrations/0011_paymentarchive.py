@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0010_partition_payment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="Месяц")),
+                (
+                    "path",
+                    models.CharField(
+                        help_text="Путь относительно PAYMENT_ARCHIVE_ROOT",
+                        max_length=255,
+                        unique=True,
+                        verbose_name="Файл",
+                    ),
+                ),
+                ("first_id", models.BigIntegerField(verbose_name="Первый id")),
+                ("last_id", models.BigIntegerField(verbose_name="Последний id")),
+                ("first_date", models.DateTimeField(verbose_name="Первая дата оплаты")),
+                (
+                    "last_date",
+                    models.DateTimeField(verbose_name="Последняя дата оплаты"),
+                ),
+                ("count", models.PositiveIntegerField(verbose_name="Число платежей")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создан"),
+                ),
+            ],
+            options={
+                "verbose_name": "Архив платежей",
+                "verbose_name_plural": "Архивы платежей",
+                "ordering": ["month", "first_id"],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0011_paymentarchive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DetachedPaymentPartition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(unique=True, verbose_name="Месяц")),
+                ("name", models.CharField(max_length=63, verbose_name="Таблица")),
+                ("dropped", models.BooleanField(default=False, verbose_name="Удалена")),
+                (
+                    "detached_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Отключена"),
+                ),
+            ],
+            options={
+                "verbose_name": "Отключенная секция платежей",
+                "verbose_name_plural": "Отключенные секции платежей",
+                "ordering": ["month"],
+            },
+        ),
+    ]
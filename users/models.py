@@ -1,4 +1,5 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 
@@ -44,6 +45,25 @@ class User(AbstractUser):
         verbose_name_plural = "Пользователи"
 
 
+class ClaimsUser(User):
+    """Пользователь, собранный из claims JWT без запроса к базе.
+
+    Поля, которых нет в токене, отложены и догружаются из базы
+    одним запросом при первом обращении к любому из них.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred_fields = self.get_deferred_fields()
+        if fields is not None and set(fields) <= deferred_fields:
+            fields = list(deferred_fields)
+        super().refresh_from_db(
+            using=using, fields=fields, from_queryset=from_queryset
+        )
+
+
 class Payment(models.Model):
     PAYMENT_METHODS_CHOICES = (("cash", "Наличными"), ("card", "Перевод на счет"))
 
@@ -78,6 +98,124 @@ class Payment(models.Model):
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
         ordering = ["-payment_date"]
+        # Таблица секционирована по месяцам payment_date (миграция 0010):
+        # индексы создаются на всех секциях, AddIndexConcurrently для нее
+        # не работает
+        indexes = [
+            # Фильтр из PaymentViewSet плюс сортировка по дате
+            models.Index(
+                fields=["paid_course", "-payment_date"], name="payment_course_date_idx"
+            ),
+            models.Index(
+                fields=["payment_method", "-payment_date"],
+                name="payment_method_date_idx",
+            ),
+            models.Index(fields=["user", "-payment_date"], name="payment_user_date_idx"),
+            # Таблица пополняется по времени, BRIN для диапазонов дат
+            # в сотни раз меньше B-tree
+            BrinIndex(fields=["payment_date"], name="payment_date_brin"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения на момент загрузки: при изменении платежа из сводки
+        # выручки вычитается старая запись
+        instance._loaded_revenue = {
+            field: instance.__dict__.get(field)
+            for field in ("payment_date", "paid_course_id", "payment_method", "amount")
+        }
+        return instance
+
+
+class PaymentRevenue(models.Model):
+    """Сводка выручки: курс x день x способ оплаты -> сумма и число платежей.
+
+    Обновляется сигналами при создании, изменении и удалении платежей,
+    пересобирается командой rebuild_payment_revenue.
+    """
+
+    day = models.DateField(verbose_name="День")
+    paid_course = models.ForeignKey(
+        "materials.Course",
+        # Строки сводки удаляются вместе с платежами через сигналы,
+        # каскад и внешний ключ в базе им не нужны
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Оплаченный курс",
+    )
+    payment_method = models.CharField(
+        max_length=20,
+        choices=Payment.PAYMENT_METHODS_CHOICES,
+        verbose_name="Способ оплаты",
+    )
+    total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сумма"
+    )
+    # Не Positive: CHECK проверяется до ON CONFLICT, а вычитание идет
+    # вставкой отрицательной дельты
+    count = models.IntegerField(default=0, verbose_name="Число платежей")
+
+    class Meta:
+        verbose_name = "Выручка за день"
+        verbose_name_plural = "Выручка по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "paid_course", "payment_method"],
+                nulls_distinct=False,
+                name="unique_payment_revenue",
+            )
+        ]
+
+
+class PaymentArchive(models.Model):
+    """Файл архива платежей: gzip NDJSON с платежами одного месяца.
+
+    Платежи старше PAYMENT_ARCHIVE_AFTER_MONTHS месяцев переносятся из
+    таблицы платежей в файлы, по диапазонам id и дат отсюда находятся
+    файлы, в которых искать архивный платеж.
+    """
+
+    month = models.DateField(verbose_name="Месяц")
+    path = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name="Файл",
+        help_text="Путь относительно PAYMENT_ARCHIVE_ROOT",
+    )
+    first_id = models.BigIntegerField(verbose_name="Первый id")
+    last_id = models.BigIntegerField(verbose_name="Последний id")
+    first_date = models.DateTimeField(verbose_name="Первая дата оплаты")
+    last_date = models.DateTimeField(verbose_name="Последняя дата оплаты")
+    count = models.PositiveIntegerField(verbose_name="Число платежей")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    class Meta:
+        verbose_name = "Архив платежей"
+        verbose_name_plural = "Архивы платежей"
+        ordering = ["month", "first_id"]
+
+
+class DetachedPaymentPartition(models.Model):
+    """Месячная секция, отключенная от таблицы платежей.
+
+    Платежи этого месяца больше не видны через Payment, поэтому сводка
+    выручки за него, как и за архивированные месяцы, не пересчитывается
+    и не сверяется.
+    """
+
+    month = models.DateField(unique=True, verbose_name="Месяц")
+    name = models.CharField(max_length=63, verbose_name="Таблица")
+    dropped = models.BooleanField(default=False, verbose_name="Удалена")
+    detached_at = models.DateTimeField(auto_now_add=True, verbose_name="Отключена")
+
+    class Meta:
+        verbose_name = "Отключенная секция платежей"
+        verbose_name_plural = "Отключенные секции платежей"
+        ordering = ["month"]
 
 
 class PaymentCourse(models.Model):
@@ -0,0 +1,172 @@
+import re
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from users.models import DetachedPaymentPartition, Payment
+
+PARTITION_NAME_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bound(month):
+    """Начало месяца в часовом поясе проекта - граница секции."""
+    return timezone.make_aware(datetime(month.year, month.month, 1))
+
+
+def payment_partition_name(month):
+    return f"{Payment._meta.db_table}_p{month:%Y_%m}"
+
+
+def payment_default_partition_name():
+    return f"{Payment._meta.db_table}_default"
+
+
+def get_payment_partitions(using=None):
+    """Месячные секции таблицы платежей: {первое число месяца: имя таблицы}."""
+    using = using or router.db_for_write(Payment)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [Payment._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME_RE.search(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return dict(sorted(partitions.items()))
+
+
+def name_partition_indexes(cursor, partition):
+    """Называет индексы секции по индексам таблицы: payment_date_brin_p2026_01.
+
+    PostgreSQL генерирует имена сам, а по ним в EXPLAIN не понять,
+    какой индекс модели использован.
+    """
+    suffix = partition.removeprefix(f"{Payment._meta.db_table}_")
+    cursor.execute(
+        """
+        SELECT child.relname, parent.relname
+        FROM pg_index
+        JOIN pg_class child ON child.oid = pg_index.indexrelid
+        JOIN pg_inherits ON pg_inherits.inhrelid = pg_index.indexrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE pg_index.indrelid = %s::regclass
+        """,
+        [partition],
+    )
+    for index, parent_index in cursor.fetchall():
+        name = f"{parent_index}_{suffix}"
+        if index != name:
+            cursor.execute(f'ALTER INDEX "{index}" RENAME TO "{name}"')
+
+
+def create_payment_partition(month, using=None):
+    """Создает секцию платежей за месяц, если ее еще нет.
+
+    Платежи этого месяца, уже попавшие в секцию по умолчанию, переносятся
+    в новую секцию. Возвращает True, если секция создана.
+    """
+    month = month_start(month)
+    using = using or router.db_for_write(Payment)
+    if month in get_payment_partitions(using):
+        return False
+
+    table = Payment._meta.db_table
+    partition = payment_partition_name(month)
+    lower, upper = month_bound(month), month_bound(add_months(month, 1))
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f'CREATE TABLE "{partition}" (LIKE "{table}")')
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM "{payment_default_partition_name()}"
+                WHERE payment_date >= %s AND payment_date < %s
+                RETURNING *
+            )
+            INSERT INTO "{partition}" SELECT * FROM moved
+            """,
+            [lower, upper],
+        )
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{partition}" '
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        name_partition_indexes(cursor, partition)
+    return True
+
+
+def default_partition_months(using=None):
+    """Месяцы платежей, которые лежат в секции по умолчанию."""
+    using = using or router.db_for_write(Payment)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT DISTINCT date_trunc('month', payment_date AT TIME ZONE %s)::date
+            FROM "{payment_default_partition_name()}"
+            """,
+            [settings.TIME_ZONE],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_payment_partitions(ahead=None, using=None):
+    """Создает секции от текущего месяца на ahead месяцев вперед.
+
+    Заодно создаются секции для платежей, осевших в секции по умолчанию.
+    Возвращает имена созданных секций.
+    """
+    if ahead is None:
+        ahead = settings.PAYMENT_PARTITIONS_AHEAD
+    current = month_start(timezone.localdate())
+    months = {add_months(current, offset) for offset in range(ahead + 1)}
+    months.update(default_partition_months(using))
+    return [
+        payment_partition_name(month)
+        for month in sorted(months)
+        if create_payment_partition(month, using)
+    ]
+
+
+def detach_payment_partitions(before, drop=False, using=None):
+    """Отключает от таблицы платежей секции месяцев раньше before.
+
+    Отключенная секция остается отдельной таблицей (или удаляется при
+    drop=True), ее платежи пропадают из Payment. Месяц записывается
+    в DetachedPaymentPartition, и сводка выручки за него больше не
+    меняется. Возвращает имена отключенных секций.
+    """
+    using = using or router.db_for_write(Payment)
+    before = month_start(before)
+    table = Payment._meta.db_table
+    detached = []
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for month, partition in get_payment_partitions(using).items():
+            if month >= before:
+                continue
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}"')
+            if drop:
+                cursor.execute(f'DROP TABLE "{partition}"')
+            DetachedPaymentPartition.objects.using(using).update_or_create(
+                month=month, defaults={"name": partition, "dropped": drop}
+            )
+            detached.append(partition)
+    return detached
@@ -1,18 +1,50 @@
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import permissions
 
+MODERATORS_GROUP = "Moders"
+
+
+def moder_cache_key(user_id):
+    return f"users:is_moder:{user_id}"
+
+
+def is_moderator(user):
+    """Проверяет членство в группе модераторов с кэшированием по пользователю.
+
+    Кэш сбрасывается сигналами при изменении групп пользователя.
+    """
+    if not user.is_authenticated:
+        return False
+
+    # Роль могла прийти вместе с пользователем из claims токена
+    if getattr(user, "_is_moder", None) is not None:
+        return user._is_moder
+
+    key = moder_cache_key(user.pk)
+    is_moder = cache.get(key)
+    if is_moder is None:
+        is_moder = user.groups.filter(name=MODERATORS_GROUP).exists()
+        cache.set(key, is_moder, settings.ROLE_CACHE_TIMEOUT)
+    return is_moder
+
 
 class IsModer(permissions.BasePermission):
     """Проверяет, является ли пользователь модератором."""
 
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="Moders").exists()
+        # Составные права (IsModer | IsOwner) вызывают проверку несколько
+        # раз за запрос, поэтому результат запоминается на самом запросе
+        if not hasattr(request, "_is_moder"):
+            request._is_moder = is_moderator(request.user)
+        return request._is_moder
 
 
 class IsOwner(permissions.BasePermission):
     """Проверяет, является ли пользователь владельцем объекта."""
 
     def has_object_permission(self, request, view, obj):
-        if obj.owner == request.user:
+        if obj.owner_id == request.user.pk:
             return True
 
         return False
@@ -0,0 +1,132 @@
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from users.models import (DetachedPaymentPartition, Payment, PaymentArchive,
+                          PaymentRevenue)
+from users.partitions import add_months
+
+
+def revenue_key(payment_date, paid_course_id, payment_method):
+    return timezone.localdate(payment_date), paid_course_id, payment_method
+
+
+def apply_revenue_delta(day, paid_course_id, payment_method, amount, count):
+    """Прибавляет сумму и число платежей к строке сводки одним upsert."""
+    table = PaymentRevenue._meta.db_table
+    with connections[router.db_for_write(PaymentRevenue)].cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (day, paid_course_id, payment_method, total, count)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT ON CONSTRAINT unique_payment_revenue DO UPDATE SET
+                total = {table}.total + EXCLUDED.total,
+                count = {table}.count + EXCLUDED.count
+            """,
+            [day, paid_course_id, payment_method, amount, count],
+        )
+
+
+def live_revenue_since(since=None):
+    """Сдвигает since за последний архивированный или отключенный месяц.
+
+    Платежи таких месяцев вынесены из таблицы, сводку за них уже
+    не пересчитать и не сверить.
+    """
+    months = [
+        model.objects.aggregate(month=Max("month"))["month"]
+        for model in (PaymentArchive, DetachedPaymentPartition)
+    ]
+    months = [month for month in months if month is not None]
+    if not months:
+        return since
+    first_live = add_months(max(months), 1)
+    return first_live if since is None or since < first_live else since
+
+
+def payment_revenue_source(since=None):
+    """Та же сводка, посчитанная по сырой таблице платежей."""
+    payments = Payment.objects.order_by()
+    if since is not None:
+        # Граница дня, а не __date: так фильтр использует индекс по payment_date
+        payments = payments.filter(
+            payment_date__gte=timezone.make_aware(datetime.combine(since, time.min))
+        )
+    return payments.values(
+        "payment_method", "paid_course", day=TruncDate("payment_date")
+    ).annotate(total=Sum("amount"), count=Count("id"))
+
+
+def rebuild_payment_revenue(since=None):
+    """Пересчитывает сводку по платежам, целиком или начиная с дня since.
+
+    Таблица сводки блокируется на время пересчета: платежи, созданные
+    параллельно, дождутся блокировки и добавят себя к уже пересчитанным
+    строкам, поэтому ничего не теряется и не считается дважды.
+    """
+    table = PaymentRevenue._meta.db_table
+    since = live_revenue_since(since)
+    rollup = PaymentRevenue.objects.all()
+    if since is not None:
+        rollup = rollup.filter(day__gte=since)
+
+    source = payment_revenue_source(since).values_list(
+        "day", "paid_course", "payment_method", "total", "count"
+    )
+    sql, params = source.query.sql_with_params()
+
+    using = router.db_for_write(PaymentRevenue)
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+            rollup._raw_delete(using)
+            cursor.execute(
+                f"INSERT INTO {table} "
+                f"(day, paid_course_id, payment_method, total, count) {sql}",
+                params,
+            )
+            return cursor.rowcount
+
+
+def verify_payment_revenue(since=None):
+    """Сравнивает сводку с платежами, возвращает список расхождений."""
+    since = live_revenue_since(since)
+    expected = {
+        (row["day"], row["paid_course"], row["payment_method"]): (
+            row["total"],
+            row["count"],
+        )
+        for row in payment_revenue_source(since).iterator()
+    }
+    rollup = PaymentRevenue.objects.all()
+    if since is not None:
+        rollup = rollup.filter(day__gte=since)
+    actual = {
+        (day, paid_course_id, payment_method): (total, count)
+        for day, paid_course_id, payment_method, total, count in rollup.values_list(
+            "day", "paid_course", "payment_method", "total", "count"
+        ).iterator()
+        # Строки, обнуленные удалением платежей, равносильны отсутствующим
+        if count or total
+    }
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys(), key=str):
+        expected_value = expected.get(key, (Decimal("0"), 0))
+        actual_value = actual.get(key, (Decimal("0"), 0))
+        if expected_value != actual_value:
+            day, paid_course_id, payment_method = key
+            mismatches.append(
+                {
+                    "day": day,
+                    "paid_course": paid_course_id,
+                    "payment_method": payment_method,
+                    "expected": expected_value,
+                    "actual": actual_value,
+                }
+            )
+    return mismatches
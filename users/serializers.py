@@ -1,6 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import Payment, PaymentCourse, User
+from users.permissions import is_moderator
 
-from users.models import User, PaymentCourse
+
+def set_user_claims(token, user):
+    """Кладет в токен данные, по которым ClaimsJWTAuthentication собирает пользователя."""
+    token["email"] = user.email
+    token["is_active"] = user.is_active
+    token["is_moder"] = is_moderator(user)
+    return token
 
 
 class UserSerializer(ModelSerializer):
@@ -15,7 +32,110 @@ class UserDetailSerializer(ModelSerializer):
         fields = "__all__"
 
 
+class PaymentSerializer(ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = "__all__"
+        read_only_fields = ["user"]
+
+
+class ArchivedPaymentQuerySerializer(serializers.Serializer):
+    """Параметры поиска в архиве платежей: ?id=1&id=2 и/или диапазон дат.
+
+    Диапазон задается обеими границами и не длиннее
+    PAYMENT_ARCHIVE_QUERY_MAX_DAYS, чтобы запрос читал лишь несколько
+    месячных архивов. Без диапазона, только по id, ищет персонал.
+    """
+
+    id = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=1000,
+    )
+    payment_date__gte = serializers.DateTimeField(required=False)
+    payment_date__lte = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        start = attrs.get("payment_date__gte")
+        end = attrs.get("payment_date__lte")
+        if start is None and end is None:
+            # Список id может задеть все архивы
+            user = self.context["request"].user
+            if not attrs.get("id") or not user.is_staff:
+                raise serializers.ValidationError(
+                    "Укажите диапазон дат payment_date__gte и payment_date__lte"
+                )
+            return attrs
+
+        if start is None or end is None:
+            raise serializers.ValidationError(
+                "Диапазон дат оплаты задается обеими границами"
+            )
+        max_days = settings.PAYMENT_ARCHIVE_QUERY_MAX_DAYS
+        if end - start > timedelta(days=max_days):
+            raise serializers.ValidationError(
+                f"Диапазон дат оплаты не длиннее {max_days} дн."
+            )
+        return attrs
+
+
+class PaymentRevenueReportSerializer(serializers.Serializer):
+    """Строка отчета по выручке, поля группировки зависят от group_by."""
+
+    day = serializers.DateField(read_only=True)
+    paid_course = serializers.IntegerField(read_only=True, allow_null=True)
+    payment_method = serializers.CharField(read_only=True)
+    total = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    count = serializers.IntegerField(read_only=True)
+
+
 class PaymentCourseSerializer(ModelSerializer):
     class Meta:
         model = PaymentCourse
         fields = "__all__"
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return set_user_claims(super().get_token(user), user)
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+
+        # Пользователь читается один раз: по нему проверяется активность
+        # и собираются claims, поэтому смена роли или блокировка доходят
+        # до токена за срок жизни access
+        try:
+            user = User.objects.get(
+                **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+            )
+        except (KeyError, User.DoesNotExist):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+
+        data = {"access": str(set_user_claims(refresh.access_token, user))}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Приложение blacklist не установлено
+                    pass
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data["refresh"] = str(refresh)
+
+        return data
@@ -0,0 +1,82 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from users.models import Payment, User
+from users.permissions import moder_cache_key
+from users.revenue import apply_revenue_delta, revenue_key
+
+
+def invalidate_moder_cache(user_ids):
+    cache.delete_many([moder_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_moder_cache([instance.pk])
+        return
+
+    # Изменение со стороны группы: group.user_set.add(...) и т.п.
+    if action in ("post_add", "post_remove"):
+        invalidate_moder_cache(pk_set)
+    elif action == "pre_clear":
+        invalidate_moder_cache(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver([post_save, pre_delete], sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Переименование или удаление группы меняет роль всех ее участников
+    invalidate_moder_cache(instance.user_set.values_list("pk", flat=True))
+
+
+REVENUE_FIELDS = ("payment_date", "paid_course_id", "payment_method", "amount")
+
+
+def current_revenue(payment):
+    return {field: getattr(payment, field) for field in REVENUE_FIELDS}
+
+
+def apply_payment_revenue(values, sign):
+    apply_revenue_delta(
+        *revenue_key(
+            values["payment_date"], values["paid_course_id"], values["payment_method"]
+        ),
+        sign * values["amount"],
+        sign,
+    )
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment_revenue(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._revenue_before = None
+        return
+
+    loaded = getattr(instance, "_loaded_revenue", None)
+    if loaded is None or None in (loaded["payment_date"], loaded["amount"]):
+        # Платеж загружен с отложенными полями
+        loaded = (
+            Payment.objects.filter(pk=instance.pk).values(*REVENUE_FIELDS).first()
+        )
+    instance._revenue_before = loaded
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_revenue(sender, instance, **kwargs):
+    """Поддерживает сводку выручки в той же транзакции, что и платеж."""
+    if instance._revenue_before is not None:
+        apply_payment_revenue(instance._revenue_before, -1)
+    apply_payment_revenue(current_revenue(instance), 1)
+    instance._loaded_revenue = current_revenue(instance)
+
+
+@receiver(post_delete, sender=Payment)
+def delete_payment_revenue(sender, instance, **kwargs):
+    loaded = getattr(instance, "_loaded_revenue", None)
+    if loaded is None or None in (loaded["payment_date"], loaded["amount"]):
+        loaded = current_revenue(instance)
+    apply_payment_revenue(loaded, -1)
@@ -1,9 +1,14 @@
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from datetime import timedelta
 import logging
 
+from users.archive import archive_old_payments
+from users.partitions import (add_months, create_payment_partitions,
+                              detach_payment_partitions, month_start)
+
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
@@ -36,3 +41,60 @@ def check_inactive_users():
             'message': str(e),
             'timestamp': timezone.now().isoformat()
         }
+
+
+@shared_task
+def maintain_payment_partitions():
+    """Создает секции платежей наперед и отключает устаревшие.
+
+    Секции старше PAYMENT_PARTITIONS_RETAIN_MONTHS месяцев отключаются,
+    если настройка задана.
+    """
+    try:
+        created = create_payment_partitions()
+        detached = []
+        if settings.PAYMENT_PARTITIONS_RETAIN_MONTHS:
+            before = add_months(
+                month_start(timezone.localdate()),
+                -settings.PAYMENT_PARTITIONS_RETAIN_MONTHS,
+            )
+            detached = detach_payment_partitions(before)
+
+        return {
+            'status': 'success',
+            'message': f'Создано секций: {len(created)}, отключено: {len(detached)}',
+            'created': created,
+            'detached': detached,
+            'timestamp': timezone.now().isoformat()
+        }
+
+    except Exception as e:
+        logger.error(f'Ошибка в задаче maintain_payment_partitions: {str(e)}')
+        return {
+            'status': 'error',
+            'message': str(e),
+            'timestamp': timezone.now().isoformat()
+        }
+
+
+@shared_task
+def archive_old_payments_task():
+    """Переносит платежи старше PAYMENT_ARCHIVE_AFTER_MONTHS месяцев в архив."""
+    if not settings.PAYMENT_ARCHIVE_AFTER_MONTHS:
+        return {'status': 'skipped', 'message': 'Архивация платежей отключена'}
+    try:
+        archives = archive_old_payments()
+        return {
+            'status': 'success',
+            'message': f'В архив перенесено платежей: {sum(archive.count for archive in archives)}',
+            'archives': [archive.path for archive in archives],
+            'timestamp': timezone.now().isoformat()
+        }
+
+    except Exception as e:
+        logger.error(f'Ошибка в задаче archive_old_payments_task: {str(e)}')
+        return {
+            'status': 'error',
+            'message': str(e),
+            'timestamp': timezone.now().isoformat()
+        }
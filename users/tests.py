@@ -1,3 +1,636 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from materials.models import Course, Lesson
+from users.archive import archive_file_path, archive_old_payments
+from users.authentication import ClaimsJWTAuthentication
+from users.models import (DetachedPaymentPartition, Payment, PaymentArchive,
+                          PaymentRevenue, User)
+from users.partitions import (add_months, create_payment_partition,
+                              detach_payment_partitions,
+                              get_payment_partitions, month_start,
+                              payment_partition_name)
+from users.permissions import is_moderator
+from users.revenue import rebuild_payment_revenue, verify_payment_revenue
+
+
+def count_group_queries(queries):
+    return sum("auth_group" in query["sql"] for query in queries)
+
+
+class ModeratorRoleCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.moderators_group, _ = Group.objects.get_or_create(name="Moders")
+        self.owner = User.objects.create(email="owner@test.com")
+        self.user = User.objects.create(email="user@test.com")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.owner
+        )
+        self.lesson = Lesson.objects.create(
+            name="Урок", course=self.course, owner=self.owner
+        )
+        self.url = reverse("materials:lesson_update", kwargs={"pk": self.lesson.pk})
+
+    def test_role_resolved_once_per_request(self):
+        """IsOwner | IsModer проверяет роль один раз за запрос"""
+        self.user.groups.add(self.moderators_group)
+        self.client.force_authenticate(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {"name": "Новое имя"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(count_group_queries(queries), 1)
+
+    def test_role_cached_across_requests(self):
+        self.user.groups.add(self.moderators_group)
+        self.client.force_authenticate(user=self.user)
+        self.client.patch(self.url, {"name": "Новое имя"})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {"name": "Еще одно имя"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(count_group_queries(queries), 0)
+
+    def test_cache_invalidated_on_group_add_and_remove(self):
+        self.assertFalse(is_moderator(self.user))
+
+        self.user.groups.add(self.moderators_group)
+        self.assertTrue(is_moderator(self.user))
+
+        self.user.groups.remove(self.moderators_group)
+        self.assertFalse(is_moderator(self.user))
+
+    def test_cache_invalidated_on_reverse_changes(self):
+        self.assertFalse(is_moderator(self.user))
+
+        self.moderators_group.user_set.add(self.user)
+        self.assertTrue(is_moderator(self.user))
+
+        self.moderators_group.user_set.clear()
+        self.assertFalse(is_moderator(self.user))
+
+    def test_cache_invalidated_on_group_delete(self):
+        self.user.groups.add(self.moderators_group)
+        self.assertTrue(is_moderator(self.user))
+
+        self.moderators_group.delete()
+
+        self.assertFalse(is_moderator(self.user))
+
+
+class ClaimsJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.moderators_group, _ = Group.objects.get_or_create(name="Moders")
+        self.user = User.objects.create(email="user@test.com", first_name="Иван")
+        self.user.set_password("testpass123")
+        self.user.save()
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+
+    def login(self, user):
+        response = self.client.post(
+            reverse("users:login"), {"email": user.email, "password": "testpass123"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {response.data['access']}"
+        )
+        return response.data
+
+    def test_request_does_not_fetch_user_row(self):
+        self.login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("materials:lesson_list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any("users_user" in query["sql"] for query in queries))
+
+    def test_token_user_can_own_objects(self):
+        self.login(self.user)
+
+        response = self.client.post(
+            reverse("materials:lesson_create"),
+            {
+                "name": "Урок",
+                "description": "Описание",
+                "course": self.course.id,
+                "owner": self.user.id,
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Lesson.objects.get().owner, self.user)
+
+    def test_moderator_claim_skips_group_query(self):
+        self.user.groups.add(self.moderators_group)
+        self.login(self.user)
+        cache.clear()
+        other_user = User.objects.create(email="other@test.com")
+        lesson = Lesson.objects.create(
+            name="Урок", course=self.course, owner=other_user
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("materials:lesson_retrieve", kwargs={"pk": lesson.pk})
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(count_group_queries(queries), 0)
+
+    def test_refresh_updates_claims(self):
+        tokens = self.login(self.user)
+        self.user.groups.add(self.moderators_group)
+
+        response = self.client.post(
+            reverse("users:token_refresh"), {"refresh": tokens["refresh"]}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(AccessToken(response.data["access"])["is_moder"])
+
+    def test_refresh_for_deleted_user_fails(self):
+        tokens = self.login(self.user)
+        self.user.delete()
+
+        response = self.client.post(
+            reverse("users:token_refresh"), {"refresh": tokens["refresh"]}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data["code"], "no_active_account")
+
+    def test_deferred_fields_loaded_in_one_query(self):
+        tokens = self.login(self.user)
+        token = AccessToken(tokens["access"])
+        user = ClaimsJWTAuthentication().get_user(token)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.first_name, "Иван")
+            self.assertIsNone(user.phone)
+
+        self.assertEqual(user, self.user)
+
+    def test_token_without_claims_falls_back_to_database(self):
+        token = AccessToken.for_user(self.user)
+
+        with self.assertNumQueries(1):
+            user = ClaimsJWTAuthentication().get_user(token)
+
+        self.assertEqual(user.email, "user@test.com")
+
+
+class PaymentRevenueTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="admin@test.com", is_staff=True)
+        self.user = User.objects.create(email="user@test.com")
+        self.course = Course.objects.create(name="Курс", owner=self.admin)
+        self.other_course = Course.objects.create(name="Другой", owner=self.admin)
+
+    def pay(self, amount, course=None, method="card", day=None):
+        payment = Payment.objects.create(
+            user=self.user,
+            paid_course=course,
+            amount=Decimal(amount),
+            payment_method=method,
+        )
+        if day is not None:
+            # payment_date заполняется auto_now_add, дату меняем сохранением
+            payment.payment_date = timezone.make_aware(
+                datetime.combine(day, datetime.min.time())
+            )
+            payment.save()
+        return payment
+
+    def revenue(self, course, method="card", day=None):
+        row = PaymentRevenue.objects.get(
+            paid_course=course,
+            payment_method=method,
+            day=day or timezone.localdate(),
+        )
+        return row.total, row.count
+
+    def test_created_payments_accumulate(self):
+        self.pay("100.00", self.course)
+        self.pay("50.50", self.course)
+        self.pay("10.00")
+
+        self.assertEqual(self.revenue(self.course), (Decimal("150.50"), 2))
+        self.assertEqual(self.revenue(None), (Decimal("10.00"), 1))
+        self.assertEqual(verify_payment_revenue(), [])
+
+    def test_changed_payment_moves_between_rows(self):
+        payment = self.pay("100.00", self.course)
+        payment = Payment.objects.get(pk=payment.pk)
+
+        payment.paid_course = self.other_course
+        payment.payment_method = "cash"
+        payment.amount = Decimal("70.00")
+        payment.save()
+
+        self.assertEqual(self.revenue(self.course), (Decimal("0.00"), 0))
+        self.assertEqual(
+            self.revenue(self.other_course, "cash"), (Decimal("70.00"), 1)
+        )
+        self.assertEqual(verify_payment_revenue(), [])
+
+    def test_deferred_payment_update(self):
+        payment = self.pay("100.00", self.course)
+        payment = Payment.objects.only("id", "amount").get(pk=payment.pk)
+
+        payment.amount = Decimal("40.00")
+        payment.save(update_fields=["amount"])
+
+        self.assertEqual(self.revenue(self.course), (Decimal("40.00"), 1))
+        self.assertEqual(verify_payment_revenue(), [])
+
+    def test_deleted_payment_subtracted(self):
+        self.pay("100.00", self.course)
+        self.pay("30.00", self.course).delete()
+
+        self.assertEqual(self.revenue(self.course), (Decimal("100.00"), 1))
+        self.assertEqual(verify_payment_revenue(), [])
+
+    def test_course_delete_cascades_payments(self):
+        self.pay("100.00", self.course)
+
+        self.course.delete()
+
+        self.assertEqual(verify_payment_revenue(), [])
+
+    def test_verify_detects_drift_and_rebuild_fixes_it(self):
+        self.pay("100.00", self.course, day=date(2026, 1, 10))
+        self.pay("20.00", self.course, day=date(2026, 1, 11))
+        # Массовое обновление обходит сигналы
+        Payment.objects.update(amount=Decimal("1.00"))
+
+        mismatches = verify_payment_revenue()
+        self.assertEqual(len(mismatches), 2)
+        self.assertEqual(len(verify_payment_revenue(since=date(2026, 1, 11))), 1)
+
+        rebuild_payment_revenue(since=date(2026, 1, 11))
+        self.assertEqual(len(verify_payment_revenue()), 1)
+
+        rebuild_payment_revenue()
+        self.assertEqual(verify_payment_revenue(), [])
+        self.assertEqual(
+            self.revenue(self.course, day=date(2026, 1, 10)), (Decimal("1.00"), 1)
+        )
+
+    def test_commands(self):
+        self.pay("100.00", self.course)
+        PaymentRevenue.objects.update(total=Decimal("1.00"))
+
+        with self.assertRaises(CommandError):
+            call_command("verify_payment_revenue", stderr=StringIO())
+
+        out = StringIO()
+        call_command("rebuild_payment_revenue", stdout=out)
+        call_command("verify_payment_revenue", stdout=out)
+
+        self.assertIn("Сводка совпадает", out.getvalue())
+
+    def test_revenue_api(self):
+        self.pay("100.00", self.course, day=date(2026, 1, 10))
+        self.pay("50.00", self.course, "cash", day=date(2026, 1, 11))
+        self.pay("25.00", self.other_course, day=date(2026, 1, 11))
+        self.client.force_authenticate(user=self.admin)
+        url = reverse("users:payment-revenue")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(
+            [(row["day"], row["total"], row["count"]) for row in response.data],
+            [("2026-01-10", "100.00", 1), ("2026-01-11", "75.00", 2)],
+        )
+
+        response = self.client.get(
+            url,
+            {"group_by": "course,method", "day__gte": "2026-01-11"},
+        )
+        self.assertEqual(
+            [
+                (row["paid_course"], row["payment_method"], row["total"])
+                for row in response.data
+            ],
+            [
+                (self.course.id, "cash", "50.00"),
+                (self.other_course.id, "card", "25.00"),
+            ],
+        )
+        self.assertNotIn("day", response.data[0])
+
+    def test_revenue_api_validation_and_permissions(self):
+        url = reverse("users:payment-revenue")
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.get(url, {"group_by": "user"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentPartitionTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="user@test.com")
+        self.current = month_start(timezone.localdate())
+        self.old_month = add_months(self.current, -24)
+
+    def pay(self, day=None):
+        payment = Payment.objects.create(
+            user=self.user, amount=Decimal("100.00"), payment_method="card"
+        )
+        if day is not None:
+            payment.payment_date = timezone.make_aware(
+                datetime.combine(day, datetime.min.time())
+            )
+            payment.save()
+        return payment
+
+    def partition_ids(self, partition):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM "{partition}"')
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_payment_lands_in_month_partition(self):
+        partitions = get_payment_partitions()
+        payment = self.pay()
+
+        self.assertIn(add_months(self.current, 1), partitions)
+        self.assertEqual(self.partition_ids(partitions[self.current]), [payment.id])
+
+    def test_new_partition_takes_rows_from_default(self):
+        payment = self.pay(self.old_month.replace(day=15))
+        self.assertEqual(self.partition_ids("users_payment_default"), [payment.id])
+
+        self.assertTrue(create_payment_partition(self.old_month))
+        self.assertFalse(create_payment_partition(self.old_month))
+
+        partition = payment_partition_name(self.old_month)
+        self.assertEqual(self.partition_ids(partition), [payment.id])
+        self.assertEqual(self.partition_ids("users_payment_default"), [])
+        self.assertTrue(Payment.objects.filter(pk=payment.pk).exists())
+
+    def test_date_filter_prunes_partitions(self):
+        start = timezone.make_aware(datetime.combine(self.current, datetime.min.time()))
+        queryset = Payment.objects.filter(
+            payment_date__gte=start, payment_date__lt=start + timedelta(days=10)
+        )
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+
+        self.assertIn(payment_partition_name(self.current), plan)
+        self.assertNotIn(payment_partition_name(add_months(self.current, 1)), plan)
+        self.assertNotIn("users_payment_default", plan)
+
+    def test_command_creates_and_detaches_partitions(self):
+        old_payment = self.pay(self.old_month)
+        payment = self.pay()
+
+        out = StringIO()
+        call_command(
+            "manage_payment_partitions",
+            ahead=5,
+            detach_before=add_months(self.old_month, 1),
+            stdout=out,
+        )
+
+        partitions = get_payment_partitions()
+        self.assertIn(add_months(self.current, 5), partitions)
+        self.assertNotIn(self.old_month, partitions)
+        self.assertIn(
+            f"Отключена секция {payment_partition_name(self.old_month)}", out.getvalue()
+        )
+        # Отключенная секция осталась отдельной таблицей
+        self.assertEqual(
+            self.partition_ids(payment_partition_name(self.old_month)),
+            [old_payment.id],
+        )
+        self.assertEqual(
+            list(Payment.objects.values_list("id", flat=True)), [payment.id]
+        )
+
+    def test_detached_months_keep_revenue(self):
+        self.pay(self.old_month)
+        self.pay()
+        create_payment_partition(self.old_month)
+
+        detach_payment_partitions(add_months(self.old_month, 1))
+
+        self.assertEqual(
+            list(DetachedPaymentPartition.objects.values_list("month", "name")),
+            [(self.old_month, payment_partition_name(self.old_month))],
+        )
+        # Платежи отключенного месяца не видны, но сводка за него сохраняется
+        self.assertEqual(verify_payment_revenue(), [])
+        rebuild_payment_revenue()
+        self.assertEqual(
+            PaymentRevenue.objects.get(day=self.old_month).total, Decimal("100.00")
+        )
+        self.assertEqual(
+            PaymentRevenue.objects.get(day=timezone.localdate()).total,
+            Decimal("100.00"),
+        )
+        self.assertEqual(verify_payment_revenue(), [])
+
+    def test_command_drop_requires_detach_before(self):
+        with self.assertRaises(CommandError):
+            call_command("manage_payment_partitions", drop=True, stdout=StringIO())
+
+
+class PaymentArchiveTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="admin@test.com", is_staff=True)
+        self.user = User.objects.create(email="user@test.com")
+        self.other = User.objects.create(email="other@test.com")
+        self.course = Course.objects.create(name="Курс", owner=self.admin)
+
+        archive_root = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_root.cleanup)
+        settings_override = override_settings(
+            PAYMENT_ARCHIVE_ROOT=Path(archive_root.name),
+            PAYMENT_ARCHIVE_AFTER_MONTHS=18,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.old_day = add_months(month_start(timezone.localdate()), -20)
+        self.old_payments = [
+            self.pay(self.user, "100.00", self.old_day),
+            self.pay(self.other, "50.00", self.old_day.replace(day=20)),
+            self.pay(self.user, "70.00", add_months(self.old_day, 1)),
+        ]
+        self.recent = self.pay(self.user, "30.00")
+        self.url = reverse("materials:payment-archived")
+
+    def pay(self, user, amount, day=None):
+        payment = Payment.objects.create(
+            user=user,
+            paid_course=self.course,
+            amount=Decimal(amount),
+            payment_method="card",
+        )
+        if day is not None:
+            payment.payment_date = timezone.make_aware(
+                datetime.combine(day, datetime.min.time())
+            )
+            payment.save()
+        return payment
+
+    def test_archive_moves_old_payments_to_monthly_files(self):
+        archives = archive_old_payments()
+
+        self.assertEqual(
+            [(archive.month, archive.count) for archive in archives],
+            [(self.old_day, 2), (add_months(self.old_day, 1), 1)],
+        )
+        self.assertEqual(
+            list(Payment.objects.values_list("id", flat=True)), [self.recent.id]
+        )
+        with gzip.open(archive_file_path(archives[0]), "rt") as file:
+            rows = [json.loads(line) for line in file]
+        self.assertEqual(
+            [(row["id"], row["user"], row["amount"]) for row in rows],
+            [
+                (self.old_payments[0].id, self.user.id, "100.00"),
+                (self.old_payments[1].id, self.other.id, "50.00"),
+            ],
+        )
+        self.assertEqual(archives[0].first_id, self.old_payments[0].id)
+        self.assertEqual(archives[0].last_id, self.old_payments[1].id)
+
+        # Выручка архивных месяцев остается в сводке и не пересчитывается
+        self.assertEqual(archive_old_payments(), [])
+        rebuild_payment_revenue()
+        self.assertEqual(
+            PaymentRevenue.objects.get(day=self.old_day).total, Decimal("100.00")
+        )
+        self.assertEqual(verify_payment_revenue(), [])
+
+    def test_archived_lookup_by_id_and_date_range(self):
+        archive_old_payments()
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.get(self.url, {"id": [self.old_payments[1].id]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [self.old_payments[1].id],
+        )
+
+        start = timezone.make_aware(
+            datetime.combine(self.old_day.replace(day=10), datetime.min.time())
+        )
+        response = self.client.get(
+            self.url,
+            {
+                "payment_date__gte": start.isoformat(),
+                "payment_date__lte": (start + timedelta(days=30)).isoformat(),
+            },
+        )
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [self.old_payments[1].id, self.old_payments[2].id],
+        )
+
+    def test_archived_lookup_is_explicit_and_scoped_to_user(self):
+        archive_old_payments()
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        start = timezone.make_aware(datetime.combine(self.old_day, datetime.min.time()))
+        response = self.client.get(
+            self.url,
+            {
+                "id": [payment.id for payment in self.old_payments],
+                "payment_date__gte": start.isoformat(),
+                "payment_date__lte": (start + timedelta(days=31)).isoformat(),
+            },
+        )
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [self.old_payments[0].id, self.old_payments[2].id],
+        )
+
+        response = self.client.get(reverse("materials:payment-list"))
+        self.assertEqual(response.data["count"], 1)
+
+    def test_archived_lookup_range_is_bounded(self):
+        """Без ограничения диапазона обычный пользователь читал бы все архивы"""
+        archive_old_payments()
+        self.client.force_authenticate(user=self.user)
+        start = timezone.make_aware(datetime.combine(self.old_day, datetime.min.time()))
+
+        for params in (
+            {"id": [self.old_payments[0].id]},
+            {"payment_date__gte": "1970-01-01T00:00:00Z"},
+            {
+                "payment_date__gte": start.isoformat(),
+                "payment_date__lte": (start + timedelta(days=32)).isoformat(),
+            },
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_archived_lookup_reads_only_requested_page(self):
+        consumed = []
+
+        def rows(**kwargs):
+            for payment_id in range(1, 101):
+                consumed.append(payment_id)
+                yield {"id": payment_id}
+
+        self.client.force_authenticate(user=self.admin)
+        with patch("materials.views.find_archived_payments", rows):
+            response = self.client.get(
+                self.url, {"id": [1], "page": 2, "page_size": 3}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["id"] for row in response.data["results"]], [4, 5, 6])
+        self.assertIsNotNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+        self.assertEqual(len(consumed), 7)
+
+    def test_archive_command(self):
+        out = StringIO()
+        call_command(
+            "archive_payments",
+            before=add_months(self.old_day, 1),
+            stdout=out,
+        )
+
+        self.assertEqual(PaymentArchive.objects.get().count, 2)
+        self.assertIn("Создано архивов: 1", out.getvalue())
+        self.assertEqual(Payment.objects.count(), 2)
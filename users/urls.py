@@ -5,9 +5,9 @@ from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
 from users.apps import UsersConfig
-from users.views import (UserCreateAPIView, UserDestroyAPIView,
-                         UserListAPIView, UserRetrieveAPIView,
-                         UserUpdateAPIView)
+from users.views import (PaymentRevenueAPIView, UserCreateAPIView,
+                         UserDestroyAPIView, UserListAPIView,
+                         UserRetrieveAPIView, UserUpdateAPIView)
 
 app_name = UsersConfig.name
 
@@ -25,6 +25,11 @@ urlpatterns = [
     ),
     path("users/<int:pk>/update/", UserUpdateAPIView.as_view(), name="user-update"),
     path("users/<int:pk>/delete/", UserDestroyAPIView.as_view(), name="user-delete"),
+    path(
+        "payments/revenue/",
+        PaymentRevenueAPIView.as_view(),
+        name="payment-revenue",
+    ),
     path(
         "login/",
         TokenObtainPairView.as_view(permission_classes=(AllowAny,)),
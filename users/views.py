@@ -1,10 +1,16 @@
+from django.db.models import Sum
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
                                      ListAPIView, RetrieveAPIView,
                                      UpdateAPIView)
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
 
-from users.models import User, PaymentCourse
-from users.serializers import UserDetailSerializer, UserSerializer, PaymentCourseSerializer
+from users.models import PaymentRevenue, User, PaymentCourse
+from users.serializers import (PaymentRevenueReportSerializer,
+                               UserDetailSerializer, UserSerializer,
+                               PaymentCourseSerializer)
 from users.services import create_stripe_session, create_stripe_price
 
 
@@ -60,3 +66,48 @@ class PaymentCourseCreateAPIView(CreateAPIView):
         payment.session_id = session_id
         payment.link = payment_link
         payment.save()
+
+
+class PaymentRevenueAPIView(ListAPIView):
+    """Выручка из сводки PaymentRevenue, без обращения к таблице платежей.
+
+    ?group_by=day,course,method задает группировку (по умолчанию day),
+    фильтры: day__gte, day__lte, paid_course, payment_method.
+    """
+
+    serializer_class = PaymentRevenueReportSerializer
+    queryset = PaymentRevenue.objects.all()
+    permission_classes = (IsAdminUser,)
+    pagination_class = None
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        "day": ["exact", "gte", "lte"],
+        "paid_course": ["exact"],
+        "payment_method": ["exact"],
+    }
+    group_by_fields = {
+        "day": "day",
+        "course": "paid_course",
+        "method": "payment_method",
+    }
+
+    def get_group_by(self):
+        names = self.request.query_params.get("group_by", "day").split(",")
+        unknown = [name for name in names if name not in self.group_by_fields]
+        if unknown:
+            raise ValidationError(
+                {"group_by": f"Допустимые значения: {', '.join(self.group_by_fields)}"}
+            )
+        return [self.group_by_fields[name] for name in dict.fromkeys(names)]
+
+    def list(self, request, *args, **kwargs):
+        group_by = self.get_group_by()
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .values(*group_by)
+            .annotate(total=Sum("total"), count=Sum("count"))
+            .filter(count__gt=0)
+            .order_by(*group_by)
+        )
+        serializer = self.get_serializer(rows, many=True)
+        return Response(serializer.data)